@@ -1,30 +1,207 @@
 #!/bin/env python3
 
 from async_work_queue import AsyncWorkQueue
+from dir_journal import FileChange, InotifyWatcher
 from enum import Enum, auto
 import os
+import threading
+import time
 
 
 class AsyncFileWalker(AsyncWorkQueue):
+	"""
+	Async file walker.
+
+	By default every file found is reported by Events.on_file.
+	In the batched mode ({batch_size} or {batch_latency} set) files are reported by Events.on_files
+	in lists of os.DirEntry, so consumers get is_file() and stat() results cached by the walk.
+	A batch is reported when it has {batch_size} entries or when {batch_latency} seconds passed
+	since its first entry (checked as the walk goes), whichever comes first.
+
+	With {directory_walker} (ParallelDirectoryWalker) set, the directories are scanned by it in parallel.
+
+	With {journal} (DirectoryJournal) set, only the files created or modified since the last scan
+	of the directory are reported by on_file (on_files), deleted files are reported by on_file_deleted.
+	Directories added by watch_directory (Linux only) are watched and their changes are enqueued as they happen,
+	when the watcher loses events (its queue overflows), the watched directories are enqueued to be scanned again.
+	"""
+
 	class Events(AsyncWorkQueue.Events):
 		def on_file(self, file_name):
 			pass
 
+		def on_files(self, file_entries):
+			pass
+
+		def on_file_deleted(self, file_name):
+			pass
+
 	class MessageTypes(Enum):
 		NEW_DIR_ENQUEUED = auto(),
+		FILE_CHANGED = auto(),
+
+	def __init__(self, event_handler, batch_size=0, batch_latency=None, directory_walker=None, journal=None,
+				 **kwargs):
+		self._directory_walker = directory_walker
+		self._journal = journal
+		self._watcher = None
+		self._watcher_lock = threading.Lock()
+		self._watched_directories = list()
+		self._batch_size = batch_size
+		self._batch_latency = batch_latency
+		super().__init__(event_handler, **kwargs)
+
+	@property
+	def is_batched(self):
+		return self._batch_size > 0 or self._batch_latency is not None
 
 	def add_directory(self, directory):
 		self._enqueue_work(AsyncFileWalker.MessageTypes.NEW_DIR_ENQUEUED, directory)
 
+	def watch_directory(self, directory):
+		"""
+		Watches the directory tree (Linux only) and enqueues its file changes.
+		"""
+		with self._watcher_lock:
+			if self._watcher is None:
+				self._watcher = InotifyWatcher(
+					lambda change, file_name: self._enqueue_work(
+						AsyncFileWalker.MessageTypes.FILE_CHANGED, (change, file_name)),
+					self._on_watcher_overflow)
+			self._watched_directories.append(directory)
+
+		self._watcher.add_watch(directory)
+
+	def _on_watcher_overflow(self):
+		with self._watcher_lock:
+			directories = list(self._watched_directories)
+
+		for directory in directories:
+			self.add_directory(directory)
+
+	def stop_request(self, drain=False):
+		# stopped outside of the lock, the watcher thread takes it on overflow
+		with self._watcher_lock:
+			watcher, self._watcher = self._watcher, None
+		if watcher is not None:
+			watcher.stop()
+
+		super().stop_request(drain)
+
 	def _file_walker_generator(self, root_directory):
-		for r, d, f in os.walk(str(root_directory), followlinks=False):
-			yield from map(lambda x: os.path.join(r, x), f)
+		"""
+		Walks the same files as os.walk(followlinks=False), but yields os.DirEntry.
+		"""
+		if self._directory_walker is not None:
+			yield from self._directory_walker.walk(root_directory)
+			return
+
+		directories = [str(root_directory)]
+		while len(directories) > 0:
+			try:
+				with os.scandir(directories.pop()) as dir_entries:
+					for entry in dir_entries:
+						if entry.is_dir():
+							if not entry.is_symlink():
+								directories.append(entry.path)
+						else:
+							yield entry
+			except OSError:
+				pass
+
+	def _journal_walker_generator(self, root_directory):
+		for change, file_name, file_stat in self._journal.scan(root_directory):
+			if change == FileChange.DELETED:
+				self._events.on_file_deleted(file_name)
+			else:
+				yield _JournalEntry(file_name, file_stat)
 
 	def _on_work_message(self, work_message):
 		if work_message.type == AsyncFileWalker.MessageTypes.NEW_DIR_ENQUEUED:
-			for file_name in self._file_walker_generator(work_message.data):
+			if self._journal is not None:
+				entries = self._journal_walker_generator(work_message.data)
+			else:
+				entries = self._file_walker_generator(work_message.data)
+
+			if self.is_batched:
+				self._walk_batched(entries)
+			else:
+				for entry in entries:
+					self._events.on_file(entry.path)
+
+		if work_message.type == AsyncFileWalker.MessageTypes.FILE_CHANGED:
+			change, file_name = work_message.data
+			if change == FileChange.DELETED:
+				self._events.on_file_deleted(file_name)
+			elif self.is_batched:
+				self._events.on_files([_JournalEntry(file_name)])
+			else:
 				self._events.on_file(file_name)
 
+	def _walk_batched(self, entries):
+		batch = list()
+		batch_start = None
+
+		for entry in entries:
+			if len(batch) == 0:
+				batch_start = time.monotonic()
+			batch.append(entry)
+
+			if len(batch) == self._batch_size or (
+					self._batch_latency is not None and time.monotonic() - batch_start >= self._batch_latency):
+				self._events.on_files(batch)
+				batch = list()
+
+		if len(batch) > 0:
+			self._events.on_files(batch)
+
+
+class _JournalStat(object):
+	"""
+	Size & mtime of a file stored by the journal scan, the other stat fields are read by os.stat on demand.
+	"""
+
+	_stat = None
+
+	def __init__(self, path, size, mtime_ns):
+		self._path = path
+		self.st_size = size
+		self.st_mtime_ns = mtime_ns
+		self.st_mtime = mtime_ns / 1e9
+
+	def __getattr__(self, name):
+		if not name.startswith('st_'):
+			raise AttributeError(name)
+		if self._stat is None:
+			self._stat = os.stat(self._path)
+		return getattr(self._stat, name)
+
+
+class _JournalEntry(object):
+	"""
+	Minimal os.DirEntry look-alike for the files reported by the journal or the watcher.
+	Files of the journal scan reuse its (size, mtime_ns), so they are not stat-ed again.
+	"""
+
+	def __init__(self, path, file_stat=None):
+		self.path = path
+		self.name = os.path.basename(path)
+		self._stat = None if file_stat is None else _JournalStat(path, *file_stat)
+
+	def is_dir(self, follow_symlinks=True):
+		return False
+
+	def is_file(self, follow_symlinks=True):
+		return True
+
+	def is_symlink(self):
+		return os.path.islink(self.path)
+
+	def stat(self, follow_symlinks=True):
+		if self._stat is None:
+			self._stat = os.stat(self.path)
+		return self._stat
+
 
 def main():
 	class AFWE(AsyncFileWalker.Events):
@@ -1,11 +1,12 @@
 #!/bin/env python3
 
-import concurrent.futures
 import threading
+import time
 from enum import Enum, auto
 
-from async_work_queue import AsyncWorkQueue
+from async_work_queue import AsyncWorkQueue, ExecutorBackend, create_executor
 from jar_opener import JavaJarDescriptor
+from work_queue_metrics import format_snapshot
 
 
 class AsyncJarOpener(AsyncWorkQueue):
@@ -30,6 +31,9 @@ class AsyncJarOpener(AsyncWorkQueue):
 		def on_work_finished(self, work_message):
 			self._consumer._on_work_finished(work_message)
 
+		def on_work_failed(self, work_message, exception):
+			self._consumer._on_work_failed(work_message, exception)
+
 		def on_all_work_done(self):
 			self._consumer._on_all_work_done()
 
@@ -49,17 +53,25 @@ class AsyncJarOpener(AsyncWorkQueue):
 
 	_MAX_CONCURRENT_EXECUTORS = 5
 
-	def __init__(self, event_handler):
+	def __init__(self, event_handler, worker_count=1, max_queue_size=0, executor_backend=ExecutorBackend.THREAD,
+				 jar_cache=None):
+		self._jar_cache = jar_cache
 		self._executor_futures_lock = threading.RLock()
 		self._executor_futures_empty_event = threading.Event()
 		self._executor_futures = set()
 		self._executor_futures_empty_event.set()
-		self._executors_pool = concurrent.futures.ThreadPoolExecutor(
-			max_workers=AsyncJarOpener._MAX_CONCURRENT_EXECUTORS,
-			# thread_name_prefix=AsyncJarOpener.__class__.__name__
-		)
+		# results of the executors are not enqueued after the stop request (no worker may be left to process them)
+		self._executor_results_lock = threading.RLock()
+		# JARs are parsed in the executors pool, the work queue only dispatches the messages
+		self._executors_pool = create_executor(executor_backend, AsyncJarOpener._MAX_CONCURRENT_EXECUTORS)
 		self._events_no_proxy = event_handler
-		super().__init__(AsyncJarOpener._AsyncWorkQueueEventsProxy(self))
+		super().__init__(
+			AsyncJarOpener._AsyncWorkQueueEventsProxy(self),
+			worker_count,
+			max_queue_size,
+			ExecutorBackend.INLINE if executor_backend == ExecutorBackend.INLINE else ExecutorBackend.THREAD
+		)
+		self._metrics.add_gauge('in_flight_futures', lambda: len(self._executor_futures))
 
 	# override of AsyncWorkQueue.Events.on_work_enqueue
 	def _on_work_enqueue(self, work_message):
@@ -69,33 +81,53 @@ class AsyncJarOpener(AsyncWorkQueue):
 	def _on_work_finished(self, work_message):
 		self._events_no_proxy.on_work_finished(work_message)
 
+	# override of AsyncWorkQueue.Events.on_work_failed
+	def _on_work_failed(self, work_message, exception):
+		self._events_no_proxy.on_work_failed(work_message, exception)
+
 	# override of AsyncWorkQueue.Events.on_all_work_done
 	def _on_all_work_done(self):
 		self._events_no_proxy.on_all_work_done()
 
 	# override of AsyncWorkQueue.Events.on_stopped
 	def _on_stopped(self):
+		# executions not started yet are cancelled, results of the running ones are dropped
+		self._executors_pool.shutdown(wait=False, cancel_futures=True)
 		self._events_no_proxy.on_stopped()
 
 	def _register_future(self, future):
 		with self._executor_futures_lock:
 			self._executor_futures_empty_event.clear()
 			self._executor_futures.add(future)
-			print('_register_future(future => %s), active futures: %d' % (str(future), len(self._executor_futures)))
 
 	def _unregister_future(self, future):
 		with self._executor_futures_lock:
 			self._executor_futures.remove(future)
 			if len(self._executor_futures) == 0:
 				self._executor_futures_empty_event.set()
-			print('_unregister_future(future => %s), active futures: %d' % (str(future), len(self._executor_futures)))
+		# results of the executors are not enqueued after the stop request (no worker may be left to process them)
+		self._executor_results_lock = threading.RLock()
 
 	def add_jar_file(self, jar_file):
 		self._enqueue_work(AsyncJarOpener.MessageTypes.NEW_JAR_ENQUEUED, jar_file)
 
 	def wait_till_all_work_done(self, timeout=None):
-		self._executor_futures_empty_event.wait(timeout=timeout)
-		super().wait_till_all_work_done(timeout=timeout)
+		# executors enqueue their results as a new work, so the work is done only when both are idle at once
+		deadline = None if timeout is None else time.monotonic() + timeout
+		while True:
+			super().wait_till_all_work_done(timeout=None if deadline is None else deadline - time.monotonic())
+			self._executor_futures_empty_event.wait(timeout=None if deadline is None else deadline - time.monotonic())
+
+			with self._executor_futures_lock:
+				if self._no_active_works_event.is_set() and len(self._executor_futures) == 0:
+					return
+
+			if deadline is not None and time.monotonic() >= deadline:
+				return
+
+	def stop_request(self, drain=False):
+		with self._executor_results_lock:
+			super().stop_request(drain)
 
 	def wait_till_stopped(self, timeout=None):
 		self._executor_futures_empty_event.wait(timeout=timeout)
@@ -107,18 +139,24 @@ class AsyncJarOpener(AsyncWorkQueue):
 	# 		future.cancel()
 
 	def _acquire_jar_opener_executor(self, work_message):
-		def _generate_executor_callback():
-			def _cb():
+		def _on_executor_done(f):
+			with self._executor_results_lock:
+				if self._stop_event.is_set():
+					return
+
+				# exceptions are passed through from the executor (even from another process)
 				try:
-					jar_descriptor = JavaJarDescriptor.load_from_file(work_message.data)
-					self._enqueue_work(AsyncJarOpener.MessageTypes.JAR_EXTRACTED, (work_message, jar_descriptor))
+					self._enqueue_work(AsyncJarOpener.MessageTypes.JAR_EXTRACTED, f.result())
 				except Exception as e:
-					self._enqueue_work(AsyncJarOpener.MessageTypes.JAR_EXTRACTION_FAILURE, (work_message, e))
-
-			return _cb
+					self._enqueue_work(AsyncJarOpener.MessageTypes.JAR_EXTRACTION_FAILURE, (work_message.data, e))
 
-		future = self._executors_pool.submit(_generate_executor_callback())
+		# load_from_file, the jar file name and the cache are picklable, so the process pool can be used as well
+		t_submit = time.perf_counter()
+		future = self._executors_pool.submit(JavaJarDescriptor.load_from_file, work_message.data, self._jar_cache)
 		self._register_future(future)
+		# time spent in the executor pool (waiting for a free executor included)
+		future.add_done_callback(lambda f: self._metrics.record_service_time('JAR_LOAD', time.perf_counter() - t_submit))
+		future.add_done_callback(_on_executor_done)
 		future.add_done_callback(lambda f: self._unregister_future(f))
 
 		return future
@@ -128,10 +166,10 @@ class AsyncJarOpener(AsyncWorkQueue):
 			self._acquire_jar_opener_executor(work_message)
 
 		if work_message.type == AsyncJarOpener.MessageTypes.JAR_EXTRACTED:
-			self._events.on_jar_extracted(work_message.data)
+			self._events_no_proxy.on_jar_extracted(work_message.data)
 
 		if work_message.type == AsyncJarOpener.MessageTypes.JAR_EXTRACTION_FAILURE:
-			self._events.on_jar_extraction_failure(*work_message.data)
+			self._events_no_proxy.on_jar_extraction_failure(*work_message.data)
 
 
 def main():
@@ -156,6 +194,7 @@ def main():
 			str(jar_file), str(exception)))
 
 	ajo = AsyncJarOpener(AJOE())
+	ajo.start_metrics_snapshots(1.0, lambda snapshot: print('Metrics: %s' % format_snapshot(snapshot)))
 
 	print('Enqueueing work...')
 	# ajo.add_jar_file('c:/webdev/NetLedger/_dist/cassandra/unboundid-ldapsdk-2.3.4.jar')
@@ -165,6 +204,7 @@ def main():
 	print('Waiting till all work is done...')
 	ajo.wait_till_all_work_done()
 	print('Work is done...')
+	print('Metrics: %s' % format_snapshot(ajo.metrics_snapshot()))
 
 	# print('Enqueueing work again...')
 	# ajo.add_jar_file('c:/webdev/NetLedger/_dist/cassandra/unboundid-ldapsdk-2.3.4.jar')
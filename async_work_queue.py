@@ -1,8 +1,12 @@
 #!/bin/env python3
 
+import concurrent.futures
 import queue
 import threading
-from enum import Enum
+import time
+from enum import Enum, auto
+
+from work_queue_metrics import WorkQueueMetrics
 
 
 class WorkIdGenerator(object):
@@ -30,6 +34,7 @@ class WorkQueueMessage(object):
 		self._work_id = work_id
 		self._message_type = message_type
 		self._message_data = message_data
+		self._enqueue_time = time.perf_counter()
 
 	def __str__(self):
 		return '%s (id: %d): %s' % (str(self._message_type), self._work_id, str(self._message_data))
@@ -46,10 +51,70 @@ class WorkQueueMessage(object):
 	def data(self):
 		return self._message_data
 
+	@property
+	def enqueue_time(self):
+		"""
+		time.perf_counter() of the message creation
+		"""
+		return self._enqueue_time
+
+
+class ExecutorBackend(Enum):
+	"""
+	Where the work of AsyncWorkQueue (and executors of its subclasses) is executed.
+	"""
+	INLINE = auto(),
+	THREAD = auto(),
+	PROCESS = auto(),
+
+
+class InlineExecutor(concurrent.futures.Executor):
+	"""
+	Executor running the submitted callable immediately in the caller thread.
+	"""
+
+	def submit(self, fn, *args, **kwargs):
+		future = concurrent.futures.Future()
+		try:
+			future.set_result(fn(*args, **kwargs))
+		except Exception as e:
+			future.set_exception(e)
+		return future
+
+
+def create_executor(executor_backend, max_workers):
+	"""
+	Creates executor for given backend.
+	Callables (and their arguments) submitted to the PROCESS executor must be picklable.
+
+	:param executor_backend: ExecutorBackend
+	:param max_workers: max. number of concurrent threads / processes (ignored by INLINE backend)
+	:return: concurrent.futures.Executor instance
+	"""
+	if executor_backend == ExecutorBackend.PROCESS:
+		return concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+
+	if executor_backend == ExecutorBackend.THREAD:
+		return concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+	return InlineExecutor()
+
 
 class AsyncWorkQueue(object):
 	"""
 	Async work queue base.
+
+	Work messages are processed by {worker_count} worker threads. When {max_queue_size} is greater than zero,
+	the queue is bounded and enqueueing blocks till some worker takes the message off the queue (backpressure).
+
+	Executor backend:
+	 - THREAD: _on_work_message is called in the worker threads.
+	 - PROCESS: as THREAD, but _process_work_message is executed in the pool of {worker_count} processes
+	   and its result is passed to _on_work_result in the worker thread.
+	 - INLINE: there are no worker threads, work is done right in the _enqueue_work caller thread.
+
+	Metrics (queue depth, service times per message type, enqueue-to-finish latency, throughput) are pulled
+	by metrics_snapshot() or pushed periodically by start_metrics_snapshots().
 	"""
 
 	class Events(object):
@@ -59,6 +124,9 @@ class AsyncWorkQueue(object):
 		def on_work_finished(self, work_message):
 			pass
 
+		def on_work_failed(self, work_message, exception):
+			pass
+
 		def on_all_work_done(self):
 			pass
 
@@ -68,56 +136,191 @@ class AsyncWorkQueue(object):
 	class MessageTypes(Enum):
 		pass
 
-	def __init__(self, event_handler):
+	# worker threads are stopped by this message (one per worker), so no polling is needed
+	_STOP_SENTINEL = object()
+
+	def __init__(self, event_handler, worker_count=1, max_queue_size=0, executor_backend=ExecutorBackend.THREAD):
+		if worker_count < 1:
+			raise ValueError('Worker count must be positive (got %d).' % worker_count)
+
 		self._events = event_handler
+		self._executor_backend = executor_backend
+		self._process_executor = None
+		if executor_backend == ExecutorBackend.PROCESS:
+			self._process_executor = create_executor(executor_backend, worker_count)
 		self._work_id_generator = WorkIdGenerator()
 		self._active_works = set()
+		self._active_works_lock = threading.RLock()
 		self._no_active_works_event = threading.Event()
-		self._work_queue = queue.Queue()
+		self._work_queue = queue.Queue(maxsize=max_queue_size)
+		self._metrics = WorkQueueMetrics()
+		self._metrics.add_gauge('queue_depth', self._work_queue.qsize)
+		self._metrics.add_gauge('active_works', lambda: len(self._active_works))
 		self._stop_event = threading.Event()
-		self._work_thread = threading.Thread(target=self._thread_loop_wrap)
-		self._work_thread.start()
+		self._drain_on_stop = False
+		self._stopped_workers_count = 0
+		self._work_threads = list()
+		if executor_backend != ExecutorBackend.INLINE:
+			self._work_threads = [threading.Thread(target=self._thread_loop_wrap) for _ in range(worker_count)]
+		for work_thread in self._work_threads:
+			work_thread.start()
+
+	@property
+	def executor_backend(self):
+		return self._executor_backend
+
+	@property
+	def metrics(self):
+		return self._metrics
 
-	def stop_request(self):
-		self._stop_event.set()
+	def metrics_snapshot(self):
+		"""
+		:return: dict with the current metrics (see WorkQueueMetrics.snapshot)
+		"""
+		return self._metrics.snapshot()
+
+	def start_metrics_snapshots(self, interval, snapshot_cb):
+		"""
+		Calls {snapshot_cb}(snapshot) every {interval} seconds (from its own thread), till the queue is stopped.
+		"""
+		self._metrics.start_periodic_snapshots(interval, snapshot_cb)
+
+	def stop_request(self, drain=False):
+		"""
+		Stops the workers promptly: they finish the work in progress, the pending work is dropped.
+		With {drain}, the work enqueued before the stop request is done first.
+		"""
+		with self._active_works_lock:
+			if self._stop_event.is_set():
+				return
+			self._drain_on_stop = drain
+			self._stop_event.set()
+
+		self._metrics.stop_periodic_snapshots()
+
+		if self._executor_backend == ExecutorBackend.INLINE:
+			self._events.on_stopped()
+
+		if not drain:
+			self._drop_pending_work()
+
+		for _ in self._work_threads:
+			self._work_queue.put(AsyncWorkQueue._STOP_SENTINEL)
+
+	def _drop_pending_work(self):
+		while True:
+			try:
+				work_message = self._work_queue.get_nowait()
+			except queue.Empty:
+				return
+
+			if work_message is not AsyncWorkQueue._STOP_SENTINEL:
+				self._finish_work(work_message)
 
 	def _enqueue_work(self, message_type, data=None):
 		work_message = WorkQueueMessage(self._work_id_generator.get_and_increment(), message_type, data)
-		self._no_active_works_event.clear()
+		with self._active_works_lock:
+			self._no_active_works_event.clear()
+			self._active_works.add(work_message.work_id)
+		self._metrics.on_enqueue()
 		self._events.on_work_enqueue(work_message)
-		self._active_works.add(work_message.work_id)
-		self._work_queue.put(work_message)
+
+		if self._executor_backend == ExecutorBackend.INLINE:
+			self._process_work(work_message)
+		else:
+			self._work_queue.put(work_message)
 
 	def wait_till_all_work_done(self, timeout=None):
 		self._no_active_works_event.wait(timeout=timeout)
 
 	def wait_till_stopped(self, timeout=None):
-		self._work_thread.join(timeout=timeout)
+		for work_thread in self._work_threads:
+			work_thread.join(timeout=timeout)
+
+	def _finish_work(self, work_message):
+		with self._active_works_lock:
+			self._active_works.remove(work_message.work_id)
+			all_work_done = len(self._active_works) == 0
+			if all_work_done:
+				self._no_active_works_event.set()
+
+		if all_work_done:
+			self._events.on_all_work_done()
+
+	def _process_work(self, work_message):
+		t = time.perf_counter()
+		try:
+			self._on_work_message(work_message)
+		except Exception as e:
+			self._metrics.on_failed()
+			self._events.on_work_failed(work_message, e)
+
+		t_finished = time.perf_counter()
+		self._metrics.on_finished(work_message.type.name, t_finished - t, t_finished - work_message.enqueue_time)
+		self._events.on_work_finished(work_message)
+		self._finish_work(work_message)
 
 	def _thread_loop_wrap(self):
-		while not self._stop_event.wait(0):
+		while True:
+			work_message = self._work_queue.get()
 
-			try:
-				work_message = self._work_queue.get(timeout=0.1)
+			if work_message is AsyncWorkQueue._STOP_SENTINEL:
+				break
 
-				self._on_work_message(work_message)
-				self._events.on_work_finished(work_message)
-				self._active_works.remove(work_message.work_id)
+			if self._stop_event.is_set() and not self._drain_on_stop:
+				# enqueued after the (non-draining) stop request
+				self._finish_work(work_message)
+				continue
 
-				if len(self._active_works) == 0:
-					self._events.on_all_work_done()
-					self._no_active_works_event.set()
+			self._process_work(work_message)
 
-			except queue.Empty:
-				pass
+		# only the last stopped worker reports the stop
+		with self._active_works_lock:
+			self._stopped_workers_count += 1
+			all_workers_stopped = self._stopped_workers_count == len(self._work_threads)
 
-		self._events.on_stopped()
+		if all_workers_stopped:
+			if self._process_executor is not None:
+				self._process_executor.shutdown()
+			self._events.on_stopped()
 
 	def _on_work_message(self, work_message):
 		"""
 		This is the main thread loop event, that should be overridden.
+		With more than one worker, it is called concurrently from all the worker threads.
+		Exception raised from here is reported by Events.on_work_failed.
+
+		Default implementation executes _process_work_message (in the process pool for PROCESS backend)
+		and passes its result to _on_work_result.
+
+		:param work_message:
+		:return:
+		"""
+		if self._process_executor is not None:
+			result = self._process_executor.submit(type(self)._process_work_message, work_message).result()
+		else:
+			result = type(self)._process_work_message(work_message)
+
+		self._on_work_result(work_message, result)
+
+	@staticmethod
+	def _process_work_message(work_message):
+		"""
+		CPU-heavy part of the work, that could be overridden (as a static method) instead of _on_work_message.
+		For PROCESS backend it is run in another process, so the work message must be picklable
+		and no instance state is available.
+
+		:param work_message:
+		:return: picklable result passed to _on_work_result
+		"""
+		return None
+
+	def _on_work_result(self, work_message, result):
+		"""
+		Result of _process_work_message, called in the worker thread.
 
 		:param work_message:
+		:param result:
 		:return:
 		"""
 		pass
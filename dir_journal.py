@@ -0,0 +1,304 @@
+#!/bin/env python3
+
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from enum import Enum, auto
+
+
+class FileChange(Enum):
+	CREATED = auto(),
+	MODIFIED = auto(),
+	DELETED = auto(),
+
+
+class DirectoryJournal(object):
+	"""
+	Persistent (SQLite) snapshot of the directory trees, so a rescan reports only the changed files.
+
+	Every directory is stored with its mtime, entry count, subdirectory names and files (size & mtime).
+	When the directory mtime did not change, its listing is not read again (only the stored subdirectories
+	are visited), so a no-change rescan costs one stat per directory instead of a listing of every directory.
+
+	Note: the directory mtime changes when an entry is created, deleted or renamed, not when a file
+	is rewritten in place. Use the watch mode (InotifyWatcher) to catch in-place modifications.
+
+	Use ':memory:' as {journal_file} for a journal living only as long as the instance.
+	"""
+
+	def __init__(self, journal_file):
+		self._journal_file = str(journal_file)
+		self._lock = threading.RLock()
+		self._connection = sqlite3.connect(self._journal_file, timeout=30, check_same_thread=False)
+		with self._connection:
+			self._connection.execute('''
+				create table if not exists dir_snapshot (
+					path text primary key,
+					mtime_ns integer,
+					entry_count integer,
+					subdirs text,
+					files text
+				)''')
+
+	@property
+	def journal_file(self):
+		return self._journal_file
+
+	def _load_snapshots(self):
+		snapshots = dict()
+		for path, mtime_ns, subdirs in self._connection.execute('select path, mtime_ns, subdirs from dir_snapshot'):
+			snapshots[path] = (mtime_ns, json.loads(subdirs))
+		return snapshots
+
+	def _load_files(self, path):
+		row = self._connection.execute('select files from dir_snapshot where path=?', (path,)).fetchone()
+		return dict() if row is None else json.loads(row[0])
+
+	def scan(self, root):
+		"""
+		Scans the tree and yields the changes since the last scan (all files are created for the first scan).
+
+		The changes are collected and the new snapshot is stored under the lock, so the concurrent scans
+		of overlapping trees do not report the same change twice. The changes are yielded after the lock
+		is released, so a slow (or abandoned) consumer does not block the other scans.
+
+		:param root: root directory
+		:return: generator of (FileChange, file path, (size, mtime_ns) of the file or None for the deleted one) tuples
+		"""
+		updates = list()
+		removed = list()
+		with self._lock:
+			changes = list(self._scan_changes(root, updates, removed))
+			with self._connection:
+				self._connection.executemany('delete from dir_snapshot where path=?', ((p,) for p in removed))
+				self._connection.executemany('insert or replace into dir_snapshot values (?, ?, ?, ?, ?)', updates)
+
+		yield from changes
+
+	def _scan_changes(self, root, updates, removed):
+		snapshots = self._load_snapshots()
+		directories = [os.path.abspath(str(root))]
+
+		while len(directories) > 0:
+			directory = directories.pop()
+			snapshot = snapshots.get(directory)
+
+			try:
+				mtime_ns = os.stat(directory).st_mtime_ns
+			except OSError:
+				if snapshot is not None:
+					yield from self._deleted_subtree(directory, snapshots, removed)
+				continue
+
+			if snapshot is not None and snapshot[0] == mtime_ns:
+				directories.extend(os.path.join(directory, d) for d in snapshot[1])
+				continue
+
+			files, subdirs = self._list_directory(directory)
+			old_files = self._load_files(directory) if snapshot is not None else dict()
+
+			for name, file_stat in files.items():
+				old_file_stat = old_files.get(name)
+				if old_file_stat is None:
+					yield FileChange.CREATED, os.path.join(directory, name), file_stat
+				elif list(old_file_stat) != list(file_stat):
+					yield FileChange.MODIFIED, os.path.join(directory, name), file_stat
+
+			for name in old_files.keys() - files.keys():
+				yield FileChange.DELETED, os.path.join(directory, name), None
+
+			if snapshot is not None:
+				for d in set(snapshot[1]) - set(subdirs):
+					yield from self._deleted_subtree(os.path.join(directory, d), snapshots, removed)
+
+			directories.extend(os.path.join(directory, d) for d in subdirs)
+			updates.append((directory, mtime_ns, len(files) + len(subdirs), json.dumps(subdirs), json.dumps(files)))
+
+	def _deleted_subtree(self, directory, snapshots, removed):
+		directories = [directory]
+		while len(directories) > 0:
+			d = directories.pop()
+			snapshot = snapshots.get(d)
+			if snapshot is None:
+				continue
+
+			for name in self._load_files(d).keys():
+				yield FileChange.DELETED, os.path.join(d, name), None
+
+			directories.extend(os.path.join(d, s) for s in snapshot[1])
+			removed.append(d)
+
+	@staticmethod
+	def _list_directory(directory):
+		files = dict()
+		subdirs = list()
+
+		try:
+			with os.scandir(directory) as dir_entries:
+				for entry in dir_entries:
+					try:
+						if entry.is_dir():
+							if not entry.is_symlink():
+								subdirs.append(entry.name)
+						else:
+							st = entry.stat()
+							files[entry.name] = (st.st_size, st.st_mtime_ns)
+					except OSError:
+						pass
+		except OSError:
+			pass
+
+		return files, subdirs
+
+
+class InotifyWatcher(object):
+	"""
+	Linux (inotify) watcher of the directory trees, reporting changed files by {on_change}(FileChange, file path)
+	from its own thread. New subdirectories are watched (and their files reported) automatically.
+
+	When the kernel event queue overflows, the events are lost and {on_overflow}() is called,
+	the watched trees should be rescanned then.
+	"""
+
+	_IN_CLOSE_WRITE = 0x00000008
+	_IN_MOVED_FROM = 0x00000040
+	_IN_MOVED_TO = 0x00000080
+	_IN_CREATE = 0x00000100
+	_IN_DELETE = 0x00000200
+	_IN_DELETE_SELF = 0x00000400
+	_IN_Q_OVERFLOW = 0x00004000
+	_IN_IGNORED = 0x00008000
+	_IN_ISDIR = 0x40000000
+	_IN_CLOEXEC = 0o2000000
+	_WATCH_MASK = _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF
+	_EVENT = struct.Struct('iIII')
+	_READ_SIZE = 64 * 1024
+
+	@staticmethod
+	def is_supported():
+		return sys.platform.startswith('linux')
+
+	def __init__(self, on_change, on_overflow=None):
+		if not InotifyWatcher.is_supported():
+			raise RuntimeError('Inotify is supported on Linux only.')
+
+		self._on_change = on_change
+		self._on_overflow = on_overflow
+		self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+		self._fd = self._libc.inotify_init1(InotifyWatcher._IN_CLOEXEC)
+		if self._fd < 0:
+			raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+		self._watches = dict()
+		self._watches_lock = threading.Lock()
+		self._created_files = set()
+		self._stop_read_fd, self._stop_write_fd = os.pipe()
+		self._thread = threading.Thread(target=self._thread_loop, daemon=True)
+		self._thread.start()
+
+	def add_watch(self, root, report_files=False):
+		"""
+		Watches the {root} tree recursively.
+
+		:param root: root directory
+		:param report_files: report all files of the tree as created (for trees appearing while watched)
+		"""
+		directories = [os.path.abspath(str(root))]
+		while len(directories) > 0:
+			directory = directories.pop()
+			wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), InotifyWatcher._WATCH_MASK)
+			if wd < 0:
+				continue
+
+			with self._watches_lock:
+				self._watches[wd] = directory
+
+			try:
+				with os.scandir(directory) as dir_entries:
+					for entry in dir_entries:
+						if entry.is_dir(follow_symlinks=False):
+							directories.append(entry.path)
+						elif report_files:
+							self._on_change(FileChange.CREATED, entry.path)
+			except OSError:
+				pass
+
+	def stop(self):
+		os.write(self._stop_write_fd, b'x')
+		self._thread.join()
+		os.close(self._fd)
+		os.close(self._stop_read_fd)
+		os.close(self._stop_write_fd)
+
+	def _thread_loop(self):
+		while True:
+			readable, _, _ = select.select([self._fd, self._stop_read_fd], [], [])
+			if self._stop_read_fd in readable:
+				break
+
+			data = os.read(self._fd, InotifyWatcher._READ_SIZE)
+			pos = 0
+			while pos + InotifyWatcher._EVENT.size <= len(data):
+				wd, mask, _, name_len = InotifyWatcher._EVENT.unpack_from(data, pos)
+				pos += InotifyWatcher._EVENT.size
+				name = os.fsdecode(data[pos:pos + name_len].rstrip(b'\0'))
+				pos += name_len
+				self._on_event(wd, mask, name)
+
+	def _on_event(self, wd, mask, name):
+		if mask & InotifyWatcher._IN_Q_OVERFLOW:
+			if self._on_overflow is not None:
+				self._on_overflow()
+			return
+
+		with self._watches_lock:
+			directory = self._watches.get(wd)
+			if mask & (InotifyWatcher._IN_IGNORED | InotifyWatcher._IN_DELETE_SELF):
+				self._watches.pop(wd, None)
+
+		if directory is None or len(name) == 0:
+			return
+
+		path = os.path.join(directory, name)
+
+		if mask & InotifyWatcher._IN_ISDIR:
+			if mask & (InotifyWatcher._IN_CREATE | InotifyWatcher._IN_MOVED_TO):
+				self.add_watch(path, report_files=True)
+			return
+
+		if mask & InotifyWatcher._IN_CREATE:
+			# reported when written completely
+			self._created_files.add(path)
+		elif mask & InotifyWatcher._IN_CLOSE_WRITE:
+			if path in self._created_files:
+				self._created_files.discard(path)
+				self._on_change(FileChange.CREATED, path)
+			else:
+				self._on_change(FileChange.MODIFIED, path)
+		elif mask & InotifyWatcher._IN_MOVED_TO:
+			self._on_change(FileChange.CREATED, path)
+		elif mask & (InotifyWatcher._IN_DELETE | InotifyWatcher._IN_MOVED_FROM):
+			self._created_files.discard(path)
+			self._on_change(FileChange.DELETED, path)
+
+
+def main(argv):
+	journal = DirectoryJournal(argv[0])
+	for root in argv[1:]:
+		t = time.perf_counter()
+		changes = {change: 0 for change in FileChange}
+		for change, _, _ in journal.scan(root):
+			changes[change] += 1
+		print('%s: %s in %.3fs' % (root, ', '.join('%s: %d' % (c.name.lower(), n) for c, n in changes.items()),
+								   time.perf_counter() - t))
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
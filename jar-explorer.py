@@ -1,10 +1,8 @@
 #!/bin/env python3
 
 import concurrent.futures
-import os
 import pathlib
 import queue
-import subprocess
 import threading
 import time
 from enum import Enum, auto
@@ -12,6 +10,12 @@ from enum import Enum, auto
 import wx
 import wx.dataview
 
+from async_file_walker import AsyncFileWalker
+from dir_journal import DirectoryJournal
+from jar_class_index import JarClassIndex
+from jar_index_cache import JarIndexCache
+from jar_opener import JavaClassDescriptor, JavaJarDescriptor
+
 
 class WorkQueueMessage(object):
 	"""
@@ -39,183 +43,6 @@ class WorkQueueMessage(object):
 		return self._data
 
 
-class WorkCounter(object):
-	def __init__(self):
-		self._counter = 0
-		self._counter_reentrant_lock = threading.RLock()
-
-	def get_and_increment(self):
-		with self._counter_reentrant_lock:
-			c = self._counter
-			self._counter += 1
-			return c
-
-
-class AsyncFileWalker(object):
-	"""
-	Async file walker
-	"""
-
-	class Events(object):
-		def on_work_enqueue(self, work_message):
-			pass
-
-		def on_work_finished(self, work_message):
-			pass
-
-		def on_all_work_done(self):
-			pass
-
-		def on_stopped(self):
-			pass
-
-	class _MessageTypes(Enum):
-		NEW_DIR_ENQUEUED = auto(),
-		STOP_REQUEST = auto(),
-
-	def __init__(self, event_handler):
-		self._events = event_handler
-		self._work_counter = WorkCounter()
-		self._active_works = set()
-		self._wqueue = queue.Queue()
-		self._wqueue_event = threading.Event()
-		self._wthread = threading.Thread(target=self._thread_loop)
-		self._wthread.start()
-
-	def add_directory(self, directory):
-		self._enqueue_work(AsyncFileWalker._MessageTypes.NEW_DIR_ENQUEUED, directory)
-
-	def stop_request(self):
-		# todo: stop request should be prioritized
-		# todo: stop request should also kill all executors
-		self._enqueue_work(AsyncFileWalker._MessageTypes.STOP_REQUEST, None)
-
-	def _enqueue_work(self, message_type, data=None):
-		work_message = WorkQueueMessage(self._work_counter.get_and_increment(), message_type, data)
-		self._events.on_work_enqueue(work_message)
-		self._active_works.add(work_message.work_id)
-		self._wqueue.put(work_message)
-		self._wqueue_event.set()
-
-	def wait_till_stopped(self, timeout=None):
-		self._wthread.join(timeout=timeout)
-
-	def _thread_loop(self):
-		while True:
-			self._wqueue_event.wait()
-			m = self._wqueue.get()
-
-			if m.type == AsyncFileWalker._MessageTypes.NEW_DIR_ENQUEUED:
-				for r, d, f in os.walk(str(m.data), followlinks=False):
-					for file_name in map(lambda x: os.path.join(r, x), f):
-						self._events.on_file(file_name)
-
-			if m.type == AsyncFileWalker._MessageTypes.STOP_REQUEST:
-				self._events.on_stopped()
-				break
-			else:
-				self._events.on_work_finished(m)
-				self._active_works.remove(m.work_id)
-
-			if len(self._active_works) == 0:
-				self._events.on_all_work_done()
-
-
-class JavaClassDescriptor(object):
-	"""
-	Single Java class descriptor
-	"""
-
-	def __init__(self, class_file):
-		self._file = class_file
-		self._name = pathlib.Path(class_file).name
-
-	@property
-	def file(self):
-		return self._file
-
-	@property
-	def name(self):
-		return self._name
-
-
-class JavaJarDescriptor(object):
-	"""
-	Single Java JAR container descriptor
-	"""
-
-	def __init__(self, jar_file, classes=None):
-		self._file = jar_file
-		self._classes = classes if classes is not None else list()
-
-	def __str__(self):
-		return '%s: %d classes' % (self._file, len(self._classes))
-
-	@classmethod
-	def load_from_file(cls, jar_file):
-		instance = cls(jar_file)
-
-		jar_opener = JarOpener(jar_file)
-		jar_opener.extract()
-
-		if jar_opener.errors is not None:
-			raise RuntimeError('Failed when parsing file \'%s\'.' % jar_file, jar_file, jar_opener.errors)
-
-		for c in jar_opener.class_files:
-			instance.add_class(JavaClassDescriptor(c))
-
-		return instance
-
-	def add_class(self, class_descriptor):
-		self._classes.append(class_descriptor)
-
-	@property
-	def file(self):
-		return self._file
-
-	@property
-	def classes(self):
-		return self._classes
-
-
-class JarOpener(object):
-	_JAR_COMMAND = ['c:/Program Files/Java/jdk1.8.0_144/bin/jar.exe', 'tf']
-	_COMMAND_OUTPUT_ENCODING = 'utf-8'
-
-	def __init__(self, jar_file):
-		self._jar_file = jar_file
-		self._errors = None
-		self._class_files = list()
-
-	def extract(self):
-		cp = subprocess.run(
-			JarOpener._JAR_COMMAND + [str(self._jar_file)],
-			stdout=subprocess.PIPE,
-			stderr=subprocess.PIPE
-		)
-
-		self._extract_class_files(cp.stdout)
-		self._extract_errors(cp.stderr)
-
-	def _extract_class_files(self, cmd_stdout):
-		if cmd_stdout is not None and len(cmd_stdout) > 0:
-			raw_lines = cmd_stdout.decode(JarOpener._COMMAND_OUTPUT_ENCODING).split(os.linesep)
-			self._class_files = list(filter(lambda x: x.endswith('.class'), [l.strip() for l in raw_lines]))
-
-	def _extract_errors(self, cmd_stderr):
-		if cmd_stderr is not None and len(cmd_stderr) > 0:
-			print(cmd_stderr)
-			self._errors = cmd_stderr.decode(JarOpener._COMMAND_OUTPUT_ENCODING)
-
-	@property
-	def class_files(self):
-		return self._class_files
-
-	@property
-	def errors(self):
-		return self._errors
-
-
 class AsyncJarOpener(object):
 	"""
 	Asynchronous Java JAR container opener.
@@ -244,8 +71,9 @@ class AsyncJarOpener(object):
 		NEW_JAR_ENQUEUED = auto(),
 		STOP_REQUEST = auto(),
 
-	def __init__(self, event_handler):
+	def __init__(self, event_handler, jar_cache=None):
 		self._events = event_handler
+		self._jar_cache = jar_cache
 		self._wqueue = queue.Queue()
 		self._wqueue_event = threading.Event()
 		self._executors_pool = concurrent.futures.ThreadPoolExecutor(
@@ -272,7 +100,7 @@ class AsyncJarOpener(object):
 		def _generate_executor_callback():
 			def _cb():
 				try:
-					self._events.on_jar_extracted(JavaJarDescriptor.load_from_file(jar_file))
+					self._events.on_jar_extracted(JavaJarDescriptor.load_from_file(jar_file, self._jar_cache))
 				except Exception as e:
 					self._events.on_jar_extraction_failure(jar_file, e)
 
@@ -336,6 +164,11 @@ class JarDispatcher(object):
 			elif f.match('*.class'):
 				self._owner._enqueue_message(JarDispatcher._MessageTypes.NEW_CLASS_FILE, file_name)
 
+		def on_file_deleted(self, file_name):
+			# the data model keeps deleted files, they are just not reported again
+			# print('JarDispatcher._AsyncFileWalkerEventsProxy.on_file_deleted(file_name => %s)' % str(file_name))
+			pass
+
 		def on_empty_queue(self):
 			# print('JarDispatcher._AsyncFileWalkerEventsProxy.on_empty_queue()')
 			pass
@@ -377,9 +210,18 @@ class JarDispatcher(object):
 		JAR_EXTRACT_ERROR = auto(),
 		STOP_REQUEST = auto(),
 
+	_JAR_INDEX_CACHE_FILE = pathlib.Path.home() / '.jar-index-cache.sqlite3'
+
 	def __init__(self, event_handler):
-		self._fwalker = AsyncFileWalker(JarDispatcher._AsyncFileWalkerEventsProxy(self))
-		self._jopener = AsyncJarOpener(JarDispatcher._AsyncJarOpenerEventsProxy(self))
+		# the data model lives as long as the dispatcher, so does the journal: rescans report only changed files
+		self._fwalker = AsyncFileWalker(
+			JarDispatcher._AsyncFileWalkerEventsProxy(self),
+			journal=DirectoryJournal(':memory:')
+		)
+		self._jopener = AsyncJarOpener(
+			JarDispatcher._AsyncJarOpenerEventsProxy(self),
+			JarIndexCache(JarDispatcher._JAR_INDEX_CACHE_FILE)
+		)
 		self._events = event_handler
 		self._wqueue = queue.Queue()
 		self._wqueue_event = threading.Event()
@@ -489,11 +331,21 @@ class JarExplorerDataModel(wx.dataview.PyDataViewModel):
 		self._classes_data = None
 		self._classes_node = None
 		self._data_lock = threading.Lock()
+		self._class_index = JarClassIndex()
 
 	def initialize(self, jar_dispatcher):
 		self._jd = jar_dispatcher
 
+	def find_classes(self, query):
+		"""
+		:param query: class name, package prefix (ending with '.') or glob
+		:return: list of (class name, jar file) tuples
+		"""
+		return self._class_index.find(query)
+
 	def jde_on_jar_file(self, java_jar_descriptor):
+		self._class_index.add_jar(java_jar_descriptor)
+
 		with self._data_lock:
 			jar_node = self.ObjectToItem(JarExplorerDataModel.JarFileNodeData(java_jar_descriptor))
 			self._data.update({jar_node: list()})
@@ -615,12 +467,15 @@ class JarExplorerGui(wx.Frame):
 		super(JarExplorerGui, self).__init__(None, wx.ID_ANY, title='Java Class Explorer', size=(800, 600))
 
 		self._jd = None
+		self._dm = None
 		self._dc = None
 		self._wx_scan_path = None
+		self._wx_find_text = None
 		self._create_gui()
 
 	def initialize(self, jar_dispatcher, data_model):
 		self._jd = jar_dispatcher
+		self._dm = data_model
 		self._dc.AssociateModel(data_model)
 		data_model.DecRef()
 
@@ -646,7 +501,8 @@ class JarExplorerGui(wx.Frame):
 		buttonScan = wx.Button(panel, wx.ID_ANY, 'Scan!')
 		self.Bind(wx.EVT_BUTTON, self.on_new_scan, buttonScan)
 		filterLabel = wx.StaticText(panel, wx.ID_ANY, ' Find: ')
-		filterText = wx.TextCtrl(panel, wx.ID_ANY, '')
+		filterText = wx.TextCtrl(panel, wx.ID_ANY, '', style=wx.TE_PROCESS_ENTER)
+		self.Bind(wx.EVT_TEXT_ENTER, self.on_find, filterText)
 
 		tool_sizer = wx.BoxSizer(wx.HORIZONTAL)
 		tool_sizer.Add(inputLabel, 0, wx.ALIGN_CENTRE_VERTICAL | wx.LEFT | wx.TOP, 5)
@@ -659,6 +515,7 @@ class JarExplorerGui(wx.Frame):
 		tool_sizer.Add(filterText, 0, wx.LEFT | wx.TOP | wx.EXPAND, 5)
 
 		self._wx_scan_path = inputPath
+		self._wx_find_text = filterText
 
 		return tool_sizer
 
@@ -713,6 +570,13 @@ class JarExplorerGui(wx.Frame):
 		print('JavaClassExplorerFrame::on_new_scan(dir => %s)' % self._wx_scan_path.GetLineText(0))
 		self._jd.scan_directory(self._wx_scan_path.GetLineText(0))
 
+	def on_find(self, event):
+		query = self._wx_find_text.GetLineText(0).strip()
+		found = self._dm.find_classes(query)
+		for class_name, jar_file in found:
+			print('%s: %s' % (class_name, jar_file))
+		self.SetStatusText('%s: found %d class(es) in %d JAR(s)' % (query, len(found), len(set(j for _, j in found))))
+
 
 def test_file_walker():
 	class AFWE(AsyncFileWalker.Events):
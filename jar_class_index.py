@@ -0,0 +1,222 @@
+#!/bin/env python3
+
+import argparse
+import array
+import bisect
+import collections
+import concurrent.futures
+import fnmatch
+import heapq
+import pathlib
+import re
+import sys
+import threading
+import time
+
+from jar_index_cache import JarIndexCache
+from jar_opener import JavaJarDescriptor
+from parallel_walker import ParallelDirectoryWalker
+
+
+def class_file_to_class_name(class_file):
+	"""
+	'com/foo/Bar$Inner.class' -> 'com.foo.Bar$Inner'
+	"""
+	return class_file[:-len('.class')].replace('/', '.') if class_file.endswith('.class') else class_file.replace('/', '.')
+
+
+def iter_jar_files(directories):
+	walker = ParallelDirectoryWalker(include=['*.jar'])
+	for directory in directories:
+		yield from (entry.path for entry in walker.walk(directory))
+
+
+class JarClassIndex(object):
+	"""
+	Reverse index of fully qualified class names to the JARs containing them.
+	Names are kept in a sorted array, so exact and package prefix lookups are binary searches,
+	glob lookups scan only the range matching the literal prefix of the pattern.
+	"""
+
+	_GLOB_CHARS = re.compile(r'[*?\[]')
+	_MAX_CHAR = '\U0010ffff'
+
+	def __init__(self):
+		self._lock = threading.RLock()
+		self._jar_files = list()
+		self._names = list()
+		self._jar_ids = array.array('I')
+		self._pending = list()
+
+	@property
+	def jar_count(self):
+		return len(self._jar_files)
+
+	@property
+	def class_count(self):
+		with self._lock:
+			return len(self._names) + len(self._pending)
+
+	def jar_file(self, jar_id):
+		return self._jar_files[jar_id]
+
+	def add_jar(self, jar_descriptor):
+		"""
+		:param jar_descriptor: JavaJarDescriptor
+		:return: jar id
+		"""
+		with self._lock:
+			jar_id = len(self._jar_files)
+			self._jar_files.append(jar_descriptor.file)
+			self._pending.extend((class_file_to_class_name(c.file), jar_id) for c in jar_descriptor.classes)
+			return jar_id
+
+	def merge_pending(self):
+		"""
+		Merges added JARs into the sorted array.
+		It is done lazily by the first lookup after additions, call it to make that lookup fast as well.
+		"""
+		with self._lock:
+			self._ensure_sorted()
+
+	def _ensure_sorted(self):
+		if len(self._pending) == 0:
+			return
+
+		merged = list(heapq.merge(zip(self._names, self._jar_ids), sorted(self._pending)))
+		self._names = [name for name, _ in merged]
+		self._jar_ids = array.array('I', (jar_id for _, jar_id in merged))
+		self._pending = list()
+
+	def _range(self, lo_name, hi_name):
+		with self._lock:
+			self._ensure_sorted()
+			lo = bisect.bisect_left(self._names, lo_name)
+			hi = bisect.bisect_right(self._names, hi_name, lo)
+			return self._names[lo:hi], self._jar_ids[lo:hi]
+
+	def _results(self, names, jar_ids):
+		return [(name, self._jar_files[jar_id]) for name, jar_id in zip(names, jar_ids)]
+
+	def find_exact(self, class_name):
+		"""
+		:param class_name: fully qualified class name, like 'com.foo.Bar'
+		:return: list of (class name, jar file) tuples
+		"""
+		return self._results(*self._range(class_name, class_name))
+
+	def find_prefix(self, prefix):
+		"""
+		:param prefix: class name prefix, like 'com.foo.' for the whole package (including sub-packages)
+		:return: list of (class name, jar file) tuples
+		"""
+		return self._results(*self._range(prefix, prefix + JarClassIndex._MAX_CHAR))
+
+	def find_glob(self, pattern):
+		"""
+		:param pattern: case-sensitive glob pattern, like 'com.foo.*Service'
+		:return: list of (class name, jar file) tuples
+		"""
+		glob_match = JarClassIndex._GLOB_CHARS.search(pattern)
+		if glob_match is None:
+			return self.find_exact(pattern)
+
+		matcher = re.compile(fnmatch.translate(pattern)).match
+		names, jar_ids = self._range(pattern[:glob_match.start()], pattern[:glob_match.start()] + JarClassIndex._MAX_CHAR)
+		return [(name, self._jar_files[jar_id]) for name, jar_id in zip(names, jar_ids) if matcher(name)]
+
+	def find(self, query):
+		"""
+		Glob lookup for queries with a wildcard, package prefix lookup for queries ending with '.',
+		exact lookup otherwise.
+		"""
+		if JarClassIndex._GLOB_CHARS.search(query) is not None:
+			return self.find_glob(query)
+
+		if query.endswith('.'):
+			return self.find_prefix(query)
+
+		return self.find_exact(query)
+
+
+def iter_jar_descriptors(directories, jar_cache=None, max_workers=8, on_error=None):
+	"""
+	Loads all JARs found in the directories (in order of the directory walk).
+
+	:param directories: directories to scan
+	:param jar_cache: optional JarIndexCache
+	:param max_workers: number of threads opening the JARs
+	:param on_error: optional callback (jar file, exception)
+	:return: generator of JavaJarDescriptor
+	"""
+	def _load(jar_file):
+		try:
+			return JavaJarDescriptor.load_from_file(jar_file, jar_cache)
+		except Exception as e:
+			if on_error is not None:
+				on_error(jar_file, e)
+			return None
+
+	# only a bounded window of JARs is loaded ahead, so the descriptors do not pile up in memory
+	with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+		futures = collections.deque()
+		for jar_file in iter_jar_files(directories):
+			futures.append(executor.submit(_load, jar_file))
+			if len(futures) >= 2 * max_workers:
+				jar_descriptor = futures.popleft().result()
+				if jar_descriptor is not None:
+					yield jar_descriptor
+
+		while len(futures) > 0:
+			jar_descriptor = futures.popleft().result()
+			if jar_descriptor is not None:
+				yield jar_descriptor
+
+
+def build_index(directories, jar_cache=None, max_workers=8, on_error=None):
+	"""
+	Builds the index of all JARs found in the directories (see iter_jar_descriptors).
+
+	:return: JarClassIndex
+	"""
+	index = JarClassIndex()
+
+	for jar_descriptor in iter_jar_descriptors(directories, jar_cache, max_workers, on_error):
+		index.add_jar(jar_descriptor)
+
+	index.merge_pending()
+	return index
+
+
+def main(argv):
+	parser = argparse.ArgumentParser(prefix_chars='-', description='Finds the JARs containing given classes.')
+	parser.add_argument('directories', type=pathlib.Path, nargs='+', help='Directories to scan for JARs.')
+	parser.add_argument('-find', action='append', default=[],
+						help='Class name, package prefix (ending with \'.\') or glob. Reads stdin when not given.')
+	parser.add_argument('-cache', type=pathlib.Path, default=pathlib.Path.home() / '.jar-index-cache.sqlite3',
+						help='JAR index cache file.')
+	parser.add_argument('-no-cache', action='store_true', help='Do not use the JAR index cache.')
+	args = parser.parse_args(argv)
+
+	t = time.perf_counter()
+	index = build_index(
+		args.directories,
+		jar_cache=None if args.no_cache else JarIndexCache(args.cache),
+		on_error=lambda jar_file, e: print('Error: %s: %s' % (jar_file, e), file=sys.stderr)
+	)
+	print('Indexed %d classes in %d JARs in %.3fs.' % (index.class_count, index.jar_count, time.perf_counter() - t))
+
+	queries = args.find if len(args.find) > 0 else (line.strip() for line in sys.stdin)
+	for query in queries:
+		if len(query) == 0:
+			continue
+
+		t = time.perf_counter()
+		found = index.find(query)
+		for class_name, jar_file in found:
+			print('%s\t%s' % (class_name, jar_file))
+		print('%s: %d found in %.3fms.' % (query, len(found), 1000 * (time.perf_counter() - t)))
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -0,0 +1,136 @@
+#!/bin/env python3
+
+import argparse
+import pathlib
+import sys
+import time
+
+from jar_class_index import class_file_to_class_name, iter_jar_descriptors
+from jar_index_cache import JarIndexCache
+
+
+class ClassDuplicate(object):
+	"""
+	Class present in more than one JAR.
+	"""
+
+	def __init__(self, class_name, occurrences):
+		self._class_name = class_name
+		self._occurrences = occurrences
+
+	def __str__(self):
+		return '%s: %s in %d JARs' % (self._class_name, 'conflict' if self.is_conflict else 'identical', len(self._occurrences))
+
+	@property
+	def class_name(self):
+		return self._class_name
+
+	@property
+	def occurrences(self):
+		"""
+		:return: list of (jar file, crc, size) tuples
+		"""
+		return self._occurrences
+
+	@property
+	def variant_count(self):
+		return len(set((crc, size) for _, crc, size in self._occurrences))
+
+	@property
+	def is_conflict(self):
+		return self.variant_count > 1
+
+
+class JarConflictDetector(object):
+	"""
+	Finds classes present in more than one JAR.
+	Copies are told apart by zip CRC32 and size of the entry (no class is extracted).
+
+	Only the first occurrence of every class name is kept, the complete list of occurrences
+	is built only for names seen more than once, so memory is proportional to the number
+	of distinct class names (plus duplicates), not to the number of all entries.
+	"""
+
+	def __init__(self):
+		self._jar_files = list()
+		self._first_occurrences = dict()
+		self._duplicates = dict()
+
+	@property
+	def jar_count(self):
+		return len(self._jar_files)
+
+	@property
+	def class_count(self):
+		return len(self._first_occurrences)
+
+	@property
+	def duplicate_count(self):
+		return len(self._duplicates)
+
+	def add_jar(self, jar_descriptor):
+		jar_id = len(self._jar_files)
+		self._jar_files.append(jar_descriptor.file)
+
+		for c in jar_descriptor.classes:
+			class_name = class_file_to_class_name(c.file)
+			occurrence = (jar_id, c.crc, c.size)
+
+			first_occurrence = self._first_occurrences.setdefault(class_name, occurrence)
+			if first_occurrence is occurrence:
+				continue
+
+			occurrences = self._duplicates.get(class_name)
+			if occurrences is None:
+				self._duplicates[class_name] = [first_occurrence, occurrence]
+			else:
+				occurrences.append(occurrence)
+
+	def iter_duplicates(self, conflicts_only=False):
+		"""
+		:param conflicts_only: skip classes having all the copies identical
+		:return: generator of ClassDuplicate, sorted by class name
+		"""
+		for class_name in sorted(self._duplicates.keys()):
+			duplicate = ClassDuplicate(
+				class_name,
+				[(self._jar_files[jar_id], crc, size) for jar_id, crc, size in self._duplicates[class_name]]
+			)
+			if not conflicts_only or duplicate.is_conflict:
+				yield duplicate
+
+
+def main(argv):
+	parser = argparse.ArgumentParser(prefix_chars='-', description='Finds classes present in more than one JAR.')
+	parser.add_argument('directories', type=pathlib.Path, nargs='+', help='Directories to scan for JARs.')
+	parser.add_argument('-conflicts-only', action='store_true', help='Report only classes with different copies.')
+	parser.add_argument('-cache', type=pathlib.Path, default=pathlib.Path.home() / '.jar-index-cache.sqlite3',
+						help='JAR index cache file.')
+	parser.add_argument('-no-cache', action='store_true', help='Do not use the JAR index cache.')
+	args = parser.parse_args(argv)
+
+	t = time.perf_counter()
+	detector = JarConflictDetector()
+	for jar_descriptor in iter_jar_descriptors(
+			args.directories,
+			jar_cache=None if args.no_cache else JarIndexCache(args.cache),
+			on_error=lambda jar_file, e: print('Error: %s: %s' % (jar_file, e), file=sys.stderr)):
+		detector.add_jar(jar_descriptor)
+
+	identical_count = conflict_count = 0
+	for duplicate in detector.iter_duplicates(args.conflicts_only):
+		if duplicate.is_conflict:
+			conflict_count += 1
+		else:
+			identical_count += 1
+
+		print(str(duplicate))
+		for jar_file, crc, size in duplicate.occurrences:
+			print('\t%08x %10d %s' % (crc, size, jar_file))
+
+	print('Scanned %d classes in %d JARs in %.3fs: %d identical duplicates, %d conflicts.' % (
+		detector.class_count, detector.jar_count, time.perf_counter() - t, identical_count, conflict_count))
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
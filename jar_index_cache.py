@@ -0,0 +1,164 @@
+#!/bin/env python3
+
+import array
+import os
+import pathlib
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+
+from jar_opener import JavaClassDescriptor
+
+
+class JarIndexCache(object):
+	"""
+	Persistent (SQLite) cache of JAR class lists.
+	Entries are keyed by the JAR path and invalidated, when size or mtime of the file differs.
+	When there are more than {max_entries} entries, the least recently used ones are evicted.
+	"""
+
+	_CLASS_NAMES_ENCODING = 'utf-8'
+	_CLASS_STATS_TYPECODE = 'Q'
+	_EVICT_EVERY_PUTS = 64
+
+	def __init__(self, cache_file, max_entries=100000):
+		self._cache_file = str(cache_file)
+		self._max_entries = max_entries
+		self._puts_lock = threading.Lock()
+		self._puts_since_evict = 0
+		self._local = threading.local()
+		self._do_with_connection(self._install)
+
+	def __getstate__(self):
+		# connections can't be pickled (process executors), every process opens its own
+		return {'cache_file': self._cache_file, 'max_entries': self._max_entries}
+
+	def __setstate__(self, state):
+		self.__init__(state['cache_file'], state['max_entries'])
+
+	@property
+	def cache_file(self):
+		return self._cache_file
+
+	@staticmethod
+	def _key(jar_file):
+		return os.path.abspath(str(jar_file))
+
+	def _connection(self):
+		connection = getattr(self._local, 'connection', None)
+		if connection is None:
+			connection = sqlite3.connect(self._cache_file, timeout=30)
+			connection.execute('pragma journal_mode=wal')
+			connection.execute('pragma synchronous=normal')
+			self._local.connection = connection
+		return connection
+
+	def _do_with_connection(self, connection_cb):
+		connection = self._connection()
+		with connection:
+			return connection_cb(connection)
+
+	@staticmethod
+	def _install(connection):
+		connection.execute('''
+			create table if not exists jar_index (
+				path text primary key,
+				size integer,
+				mtime_ns integer,
+				class_count integer,
+				class_names blob,
+				class_stats blob,
+				last_access real
+			)''')
+		connection.execute('create index if not exists ix_jar_index_last_access on jar_index(last_access)')
+
+	@staticmethod
+	def _encode(class_descriptors):
+		names = '\n'.join(c.file for c in class_descriptors).encode(JarIndexCache._CLASS_NAMES_ENCODING)
+		stats = array.array(JarIndexCache._CLASS_STATS_TYPECODE)
+		for c in class_descriptors:
+			stats.extend((c.crc or 0, c.size or 0, c.compressed_size or 0))
+		return zlib.compress(names), zlib.compress(stats.tobytes())
+
+	@staticmethod
+	def _decode(class_count, class_names, class_stats):
+		if class_count == 0:
+			return list()
+
+		names = zlib.decompress(class_names).decode(JarIndexCache._CLASS_NAMES_ENCODING).split('\n')
+		stats = array.array(JarIndexCache._CLASS_STATS_TYPECODE)
+		stats.frombytes(zlib.decompress(class_stats))
+		return [JavaClassDescriptor(name, *stats[i * 3:i * 3 + 3]) for i, name in enumerate(names)]
+
+	def get(self, jar_file, stat_result):
+		"""
+		:param jar_file: JAR path
+		:param stat_result: os.stat() of the JAR
+		:return: list of JavaClassDescriptor or None, when not cached (or cached entry is stale)
+		"""
+		key = JarIndexCache._key(jar_file)
+
+		def _reader(connection):
+			row = connection.execute(
+				'select class_count, class_names, class_stats from jar_index where path=? and size=? and mtime_ns=?',
+				(key, stat_result.st_size, stat_result.st_mtime_ns)).fetchone()
+			if row is not None:
+				connection.execute('update jar_index set last_access=? where path=?', (time.time(), key))
+			return row
+
+		row = self._do_with_connection(_reader)
+		return None if row is None else JarIndexCache._decode(*row)
+
+	def put(self, jar_file, stat_result, class_descriptors):
+		class_names, class_stats = JarIndexCache._encode(class_descriptors)
+
+		self._do_with_connection(lambda connection: connection.execute(
+			'insert or replace into jar_index(path, size, mtime_ns, class_count, class_names, class_stats, last_access)'
+			' values (?, ?, ?, ?, ?, ?, ?)',
+			(JarIndexCache._key(jar_file), stat_result.st_size, stat_result.st_mtime_ns, len(class_descriptors),
+			 class_names, class_stats, time.time())))
+
+		with self._puts_lock:
+			self._puts_since_evict += 1
+			evict = self._puts_since_evict >= JarIndexCache._EVICT_EVERY_PUTS
+			if evict:
+				self._puts_since_evict = 0
+
+		if evict:
+			self.evict()
+
+	def invalidate(self, jar_file):
+		self._do_with_connection(lambda connection: connection.execute(
+			'delete from jar_index where path=?', (JarIndexCache._key(jar_file),)))
+
+	def clear(self):
+		self._do_with_connection(lambda connection: connection.execute('delete from jar_index'))
+
+	def evict(self):
+		"""
+		Removes the least recently used entries over the {max_entries} limit.
+		"""
+		self._do_with_connection(lambda connection: connection.execute(
+			'delete from jar_index where path in ('
+			' select path from jar_index order by last_access desc limit -1 offset ?)',
+			(self._max_entries,)))
+
+	@property
+	def entry_count(self):
+		return self._do_with_connection(lambda connection: connection.execute(
+			'select count(*) from jar_index').fetchone()[0])
+
+
+def main(argv):
+	cache = JarIndexCache(pathlib.Path.home() / '.jar-index-cache.sqlite3')
+	print('Cache file: %s, entries: %d' % (cache.cache_file, cache.entry_count))
+
+	for jar_file in argv:
+		cached = cache.get(jar_file, os.stat(jar_file))
+		print('%s: %s' % (jar_file, 'not cached' if cached is None else '%d classes cached' % len(cached)))
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
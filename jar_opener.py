@@ -1,9 +1,10 @@
 #!/bin/env python3
 
 
+import mmap
 import os
-import pathlib
-import subprocess
+import struct
+import zipfile
 
 
 class JavaClassDescriptor(object):
@@ -11,9 +12,12 @@ class JavaClassDescriptor(object):
 	Single Java class descriptor
 	"""
 
-	def __init__(self, class_file):
+	def __init__(self, class_file, crc=None, size=None, compressed_size=None):
 		self._file = class_file
-		self._name = pathlib.Path(class_file).name
+		self._name = os.path.basename(class_file)
+		self._crc = crc
+		self._size = size
+		self._compressed_size = compressed_size
 
 	def __str__(self):
 		return '%s: %s' % (self._file, self._name)
@@ -26,6 +30,18 @@ class JavaClassDescriptor(object):
 	def name(self):
 		return self._name
 
+	@property
+	def crc(self):
+		return self._crc
+
+	@property
+	def size(self):
+		return self._size
+
+	@property
+	def compressed_size(self):
+		return self._compressed_size
+
 
 class JavaJarDescriptor(object):
 	"""
@@ -40,7 +56,19 @@ class JavaJarDescriptor(object):
 		return '%s: %d classes' % (self._file, len(self._classes))
 
 	@classmethod
-	def load_from_file(cls, jar_file):
+	def load_from_file(cls, jar_file, jar_cache=None):
+		"""
+		:param jar_file: JAR path
+		:param jar_cache: optional JarIndexCache, cache hits are served without opening the archive
+		:return: JavaJarDescriptor instance
+		"""
+		stat_result = None
+		if jar_cache is not None:
+			stat_result = os.stat(jar_file)
+			cached_classes = jar_cache.get(jar_file, stat_result)
+			if cached_classes is not None:
+				return cls(jar_file, cached_classes)
+
 		instance = cls(jar_file)
 
 		jar_opener = JarOpener(jar_file)
@@ -49,8 +77,11 @@ class JavaJarDescriptor(object):
 		if jar_opener.errors is not None:
 			raise RuntimeError('Failed when parsing file \'%s\'.' % jar_file, jar_file, jar_opener.errors)
 
-		for c in jar_opener.class_files:
-			instance.add_class(JavaClassDescriptor(c))
+		for c in jar_opener.class_descriptors:
+			instance.add_class(c)
+
+		if jar_cache is not None:
+			jar_cache.put(jar_file, stat_result, instance.classes)
 
 		return instance
 
@@ -66,38 +97,213 @@ class JavaJarDescriptor(object):
 		return self._classes
 
 
+class JarEntry(object):
+	"""
+	Single entry of the JAR (zip) central directory.
+	"""
+
+	def __init__(self, name, crc, size, compressed_size):
+		self._name = name
+		self._crc = crc
+		self._size = size
+		self._compressed_size = compressed_size
+
+	def __str__(self):
+		return '%s (crc: %08x, size: %d, compressed: %d)' % (self._name, self._crc, self._size, self._compressed_size)
+
+	@property
+	def name(self):
+		return self._name
+
+	@property
+	def crc(self):
+		return self._crc
+
+	@property
+	def size(self):
+		return self._size
+
+	@property
+	def compressed_size(self):
+		return self._compressed_size
+
+	@property
+	def is_class(self):
+		return self._name.endswith('.class')
+
+
+class JarIndexReader(object):
+	"""
+	Lists JAR (zip) entries right from the central directory at the end of the archive.
+	No entry is decompressed (not even its local header is read), so listing costs only
+	a read of the central directory.
+	"""
+
+	_EOCD = struct.Struct('<IHHHHIIH')
+	_EOCD_SIGNATURE = 0x06054b50
+	_EOCD64_LOCATOR = struct.Struct('<IIQI')
+	_EOCD64_LOCATOR_SIGNATURE = 0x07064b50
+	_EOCD64 = struct.Struct('<IQHHIIQQQQ')
+	_EOCD64_SIGNATURE = 0x06064b50
+	_CENTRAL_DIR_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+	_CENTRAL_DIR_HEADER_SIGNATURE = 0x02014b50
+	_EXTRA_HEADER = struct.Struct('<HH')
+	_EXTRA_ZIP64_ID = 0x0001
+	_MAX_COMMENT_SIZE = 0xffff
+	_FLAG_UTF8 = 0x800
+
+	def __init__(self, jar_file, use_mmap=True):
+		self._jar_file = jar_file
+		self._use_mmap = use_mmap
+
+	def iter_entries(self):
+		"""
+		Lazily yields all JarEntry items of the archive.
+
+		:return: generator of JarEntry
+		:raises zipfile.BadZipFile: when the central directory is not found or is damaged
+		"""
+		with open(self._jar_file, 'rb') as fh:
+			if self._use_mmap:
+				try:
+					data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+				except ValueError:
+					# empty file can't be mapped
+					raise zipfile.BadZipFile('File \'%s\' is not a zip file.' % self._jar_file)
+				try:
+					yield from self._iter_central_directory(data)
+				finally:
+					data.close()
+			else:
+				yield from self._iter_central_directory_from_file(fh)
+
+	def iter_class_descriptors(self):
+		"""
+		Lazily yields JavaClassDescriptor for every *.class entry of the archive.
+		"""
+		for entry in self.iter_entries():
+			if entry.is_class:
+				yield JavaClassDescriptor(entry.name, entry.crc, entry.size, entry.compressed_size)
+
+	def _iter_central_directory_from_file(self, fh):
+		# read just the tail (end of central directory record), then the central directory itself
+		file_size = fh.seek(0, 2)
+		tail_size = min(file_size, JarIndexReader._MAX_COMMENT_SIZE + JarIndexReader._EOCD.size
+						+ JarIndexReader._EOCD64_LOCATOR.size + JarIndexReader._EOCD64.size)
+		fh.seek(file_size - tail_size)
+		tail = fh.read(tail_size)
+		cd_offset, cd_size, entry_count = self._read_central_directory_location(tail, file_size - tail_size)
+
+		fh.seek(cd_offset)
+		cd_data = fh.read(cd_size)
+		yield from self._iter_central_directory_records(cd_data, 0, entry_count)
+
+	def _iter_central_directory(self, data):
+		cd_offset, _, entry_count = self._read_central_directory_location(data, 0)
+		yield from self._iter_central_directory_records(data, cd_offset, entry_count)
+
+	def _read_central_directory_location(self, data, data_offset):
+		"""
+		:param data: buffer containing (at least) the end of the archive
+		:param data_offset: offset of the buffer within the archive
+		:return: tuple (central directory offset within the archive, central directory size, entry count)
+		"""
+		eocd_pos = data.rfind(struct.pack('<I', JarIndexReader._EOCD_SIGNATURE),
+							  max(0, len(data) - JarIndexReader._MAX_COMMENT_SIZE - JarIndexReader._EOCD.size))
+		if eocd_pos < 0 or eocd_pos + JarIndexReader._EOCD.size > len(data):
+			raise zipfile.BadZipFile('File \'%s\' is not a zip file.' % self._jar_file)
+
+		_, _, _, _, entry_count, cd_size, cd_offset, _ = JarIndexReader._EOCD.unpack_from(data, eocd_pos)
+		cd_end = data_offset + eocd_pos
+
+		locator_pos = eocd_pos - JarIndexReader._EOCD64_LOCATOR.size
+		if locator_pos >= 0:
+			locator = JarIndexReader._EOCD64_LOCATOR.unpack_from(data, locator_pos)
+			if locator[0] == JarIndexReader._EOCD64_LOCATOR_SIGNATURE:
+				eocd64_pos = locator_pos - JarIndexReader._EOCD64.size
+				if eocd64_pos < 0:
+					raise zipfile.BadZipFile('Zip64 end of central directory of \'%s\' not found.' % self._jar_file)
+				eocd64 = JarIndexReader._EOCD64.unpack_from(data, eocd64_pos)
+				if eocd64[0] != JarIndexReader._EOCD64_SIGNATURE:
+					raise zipfile.BadZipFile('Zip64 end of central directory of \'%s\' is damaged.' % self._jar_file)
+				entry_count, cd_size, cd_offset = eocd64[7:10]
+				cd_end = data_offset + eocd64_pos
+
+		# data prepended to the archive (like in self-extracting archives) shifts all the offsets
+		prepended_size = cd_end - cd_size - cd_offset
+		if prepended_size < 0:
+			raise zipfile.BadZipFile('Central directory of \'%s\' is damaged.' % self._jar_file)
+
+		return cd_offset + prepended_size, cd_size, entry_count
+
+	def _iter_central_directory_records(self, data, pos, entry_count):
+		header = JarIndexReader._CENTRAL_DIR_HEADER
+		for _ in range(entry_count):
+			if pos + header.size > len(data):
+				raise zipfile.BadZipFile('Central directory of \'%s\' is truncated.' % self._jar_file)
+
+			(signature, _, _, flags, _, _, _, crc, compressed_size, size,
+			 name_len, extra_len, comment_len, _, _, _, _) = header.unpack_from(data, pos)
+
+			if signature != JarIndexReader._CENTRAL_DIR_HEADER_SIGNATURE:
+				raise zipfile.BadZipFile('Central directory of \'%s\' is damaged.' % self._jar_file)
+
+			name_pos = pos + header.size
+			raw_name = bytes(data[name_pos:name_pos + name_len])
+			name = raw_name.decode('utf-8' if flags & JarIndexReader._FLAG_UTF8 else 'cp437')
+
+			if size == 0xffffffff or compressed_size == 0xffffffff:
+				extra_pos = name_pos + name_len
+				size, compressed_size = self._read_zip64_sizes(
+					bytes(data[extra_pos:extra_pos + extra_len]), size, compressed_size)
+
+			yield JarEntry(name, crc, size, compressed_size)
+			pos = name_pos + name_len + extra_len + comment_len
+
+	@staticmethod
+	def _read_zip64_sizes(extra, size, compressed_size):
+		pos = 0
+		while pos + JarIndexReader._EXTRA_HEADER.size <= len(extra):
+			extra_id, extra_size = JarIndexReader._EXTRA_HEADER.unpack_from(extra, pos)
+			pos += JarIndexReader._EXTRA_HEADER.size
+			if extra_id == JarIndexReader._EXTRA_ZIP64_ID:
+				# only the fields set to 0xffffffff are present, in this order
+				values = iter(struct.unpack_from('<%dQ' % (extra_size // 8), extra, pos))
+				if size == 0xffffffff:
+					size = next(values)
+				if compressed_size == 0xffffffff:
+					compressed_size = next(values)
+				break
+			pos += extra_size
+
+		return size, compressed_size
+
+
 class JarOpener(object):
-	_JAR_COMMAND = ['c:/Program Files/Java/jdk1.8.0_144/bin/jar.exe', 'tf']
-	_COMMAND_OUTPUT_ENCODING = 'utf-8'
+	"""
+	Lists the class files of the JAR in-process (see JarIndexReader).
+	"""
 
-	def __init__(self, jar_file):
+	def __init__(self, jar_file, use_mmap=True):
 		self._jar_file = jar_file
+		self._use_mmap = use_mmap
 		self._errors = None
-		self._class_files = list()
+		self._class_descriptors = list()
 
 	def extract(self):
-		cp = subprocess.run(
-			JarOpener._JAR_COMMAND + [str(self._jar_file)],
-			stdout=subprocess.PIPE,
-			stderr=subprocess.PIPE
-		)
-
-		self._extract_class_files(cp.stdout)
-		self._extract_errors(cp.stderr)
+		try:
+			reader = JarIndexReader(self._jar_file, use_mmap=self._use_mmap)
+			self._class_descriptors = list(reader.iter_class_descriptors())
+		except (OSError, zipfile.BadZipFile, UnicodeDecodeError) as e:
+			self._errors = str(e)
 
-	def _extract_class_files(self, cmd_stdout):
-		if cmd_stdout is not None and len(cmd_stdout) > 0:
-			raw_lines = cmd_stdout.decode(JarOpener._COMMAND_OUTPUT_ENCODING).split(os.linesep)
-			self._class_files = list(filter(lambda x: x.endswith('.class'), [l.strip() for l in raw_lines]))
-
-	def _extract_errors(self, cmd_stderr):
-		if cmd_stderr is not None and len(cmd_stderr) > 0:
-			print(cmd_stderr)
-			self._errors = cmd_stderr.decode(JarOpener._COMMAND_OUTPUT_ENCODING)
+	@property
+	def class_descriptors(self):
+		return self._class_descriptors
 
 	@property
 	def class_files(self):
-		return self._class_files
+		return [c.file for c in self._class_descriptors]
 
 	@property
 	def errors(self):
@@ -15,7 +15,6 @@ import sys
 import tempfile
 import time
 from collections import OrderedDict
-from collections import deque
 from enum import Enum, auto
 
 import math
@@ -26,6 +25,8 @@ from pyftpdlib.log import config_logging as ftpd_config_logging
 # receiver
 from pyftpdlib.servers import FTPServer
 
+from parallel_walker import ParallelDirectoryWalker
+
 
 class RunMode(Enum):
 	EMITTER = auto(),
@@ -68,25 +69,24 @@ def get_default_config(mode, emitter_paths=None, ip_port=9731, home_dir='./temp/
 	return config
 
 
-def deep_walk_files(root):
+def deep_walk_files(root, max_workers=8, ordered=False, include=None, exclude=None, max_depth=None):
 	"""
-	Walks all files in the {root} recursively
+	Walks all files in the {root} recursively.
+	Directories are scanned in parallel (see ParallelDirectoryWalker for the arguments).
 
 	:param root: root path
-	:return: generator with file paths relative to root
+	:return: generator with file paths (full path)
 	"""
-	dir_queue = deque([root])
+	walker = ParallelDirectoryWalker(
+		max_workers=max_workers,
+		ordered=ordered,
+		include=include,
+		exclude=exclude,
+		max_depth=max_depth
+	)
 
-	try:
-		base = dir_queue.popleft()
-		for r, d, f in os.walk(base, followlinks=False):
-			# yield all files (full path)
-			yield from map(lambda x: os.path.join(r, x), f)
-			# enqueue all child directories
-			dir_queue.extend(os.path.join(r, x) for x in d)
-
-	except IndexError:
-		'''end of iteration'''
+	for entry in walker.walk(root):
+		yield entry.path
 
 
 def time_diff_format(seconds):
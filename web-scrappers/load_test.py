@@ -0,0 +1,99 @@
+#!/bin/env python3
+"""
+Local load test of the gallery and stats pages.
+
+Runs the application in a local threaded server and hits the pages from several client threads:
+without the page cache, with the page cache and with the page cache and ETag revalidation (304 responses),
+and prints the requests per second of every run.
+"""
+import argparse
+import logging
+import threading
+import time
+import urllib.request
+import urllib.error
+import werkzeug.serving
+import scrapper
+
+
+def _client_loop(url_list:list, stop_event:threading.Event, counters:list, use_etag:bool):
+	etags = dict()
+	i = 0
+	while not stop_event.is_set():
+		url = url_list[i % len(url_list)]
+		i += 1
+		req = urllib.request.Request(url)
+		if use_etag and url in etags:
+			req.add_header("If-None-Match", etags[url])
+		try:
+			with urllib.request.urlopen(req) as r:
+				r.read()
+				if r.headers.get("ETag") is not None:
+					etags[url] = r.headers.get("ETag")
+			counters[0] += 1
+		except urllib.error.HTTPError as e:
+			# 304 Not Modified is raised by urllib
+			counters[0 if e.code == 304 else 1] += 1
+
+
+def run_load(base_url:str, paths:list, client_count:int, duration:float, use_etag:bool):
+	url_list = [base_url + p for p in paths]
+	stop_event = threading.Event()
+	counters = [[0, 0] for _ in range(client_count)]
+	clients = [threading.Thread(target=_client_loop, args=(url_list, stop_event, counters[n], use_etag)) for n in range(client_count)]
+
+	ts_start = time.perf_counter()
+	for c in clients:
+		c.start()
+	time.sleep(duration)
+	stop_event.set()
+	for c in clients:
+		c.join()
+	elapsed = time.perf_counter() - ts_start
+
+	succ_count = sum(c[0] for c in counters)
+	fail_count = sum(c[1] for c in counters)
+	return succ_count / elapsed, fail_count
+
+
+def main():
+	parser = argparse.ArgumentParser(prefix_chars="-", description="Local load test of the gallery and stats pages.")
+	parser.add_argument("-clients", type=int, default=8, help="Number of client threads.")
+	parser.add_argument("-duration", type=float, default=5.0, help="Duration of every run in seconds.")
+	parser.add_argument("-paths", nargs="+", default=["/view/roumen/", "/view/roumen-maso/", "/stats/"], help="Paths to request.")
+	args = parser.parse_args()
+
+	# debug output (page data dump) would dominate the rendering time
+	scrapper.app.debug = False
+	scrapper.SETTINGS["flask"]["debug"] = False
+	logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+	# impressions are flushed as in the running application (scraps are not scheduled)
+	if scrapper.SETTINGS["impressions"]["enabled"]:
+		scrapper.impression_counter.start()
+
+	server = werkzeug.serving.make_server("127.0.0.1", 0, scrapper.app, threaded=True)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	base_url = f"http://127.0.0.1:{server.port}"
+
+	runs = [
+		("no cache", False, False),
+		("page cache", True, False),
+		("page cache + etag", True, True),
+	]
+
+	try:
+		for run_name, cache_enabled, use_etag in runs:
+			scrapper.SETTINGS["cache"]["enabled"] = cache_enabled
+			scrapper.page_cache.invalidate()
+			rps, fail_count = run_load(base_url, args.paths, args.clients, args.duration, use_etag)
+			print(f"{run_name:20}: {rps:8.1f} requests/sec, {fail_count} failed")
+	finally:
+		server.shutdown()
+		# impressions of all the runs were written by a few batched flushes
+		scrapper.impression_counter.stop()
+		print(f"impressions: {scrapper.impression_counter.stats}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,141 @@
+#!/bin/env python3
+"""
+Downloads of the Roumen scrapper against a local HTTP server standing in for the site.
+
+The server serves a listing page and the images, some of them answered with retryable statuses first,
+slower for the earlier images (so the downloads finish out of their order) and one of them missing.
+
+Run: python -m unittest roumen_test
+"""
+import http.server
+import pathlib
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from scrappers import Settings, Source
+from scrappers.result import ResultItemStatus
+from scrappers.impl.roumen import BaseRoumen, _RoumenSettings
+
+
+# image name -> statuses answered before the image itself
+_IMAGE_FAILURES = {
+	"img-1.jpg": [],
+	"img-2.jpg": [503, 503],
+	"img-3.jpg": [],
+	"img-4.jpg": [429],
+	"img-5.jpg": [],
+	"img-6.jpg": [500],
+}
+_MISSING_IMAGE = "img-missing.jpg"
+# the "top" image of the page is scrapped last
+_LISTED_IMAGES = ["img-6.jpg", "img-5.jpg", _MISSING_IMAGE, "img-4.jpg", "img-3.jpg", "img-2.jpg", "img-1.jpg"]
+_SUBMITTED_IMAGES = list(reversed(_LISTED_IMAGES))
+
+
+class _StandInHandler(http.server.BaseHTTPRequestHandler):
+	def log_message(self, format, *args):
+		pass
+
+	def _send(self, status:int, body:bytes=b"", content_type:str="application/octet-stream"):
+		self.send_response(status)
+		self.send_header("Content-Type", content_type)
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def do_GET(self):
+		server = self.server
+		if self.path == "/":
+			links = "".join(f'<a href="/roumingShow.php?file={name}">{name}</a>' for name in _LISTED_IMAGES)
+			self._send(200, f"<html><body>{links}</body></html>".encode("utf-8"), "text/html; charset=utf-8")
+			return
+
+		name = self.path.rsplit("/", 1)[-1]
+		with server.lock:
+			server.requests.append(name)
+			statuses = server.failures.get(name)
+			status = statuses.pop(0) if statuses else None
+
+		if name not in _IMAGE_FAILURES:
+			self._send(404)
+		elif status is not None:
+			self._send(status)
+		else:
+			# the first submitted images are the slowest ones
+			time.sleep(0.05 * (len(_SUBMITTED_IMAGES) - _SUBMITTED_IMAGES.index(name)))
+			self._send(200, f"content of {name}".encode("utf-8"), "image/jpeg")
+
+
+class RoumenDownloadTest(unittest.TestCase):
+	def setUp(self):
+		self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _StandInHandler)
+		self._server.lock = threading.Lock()
+		self._server.requests = list()
+		self._server.failures = {name: list(statuses) for (name, statuses) in _IMAGE_FAILURES.items()}
+		threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+		self._temp_dir = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+		base_path = pathlib.Path(self._temp_dir.name)
+		self._sqlite_datafile = base_path / "test.sqlite3"
+		self._settings = Settings(base_path, pathlib.Path("scrap"), self._sqlite_datafile,
+								  download_workers=4, download_retries=3, download_backoff=0.01, download_timeout=5.0)
+
+	def tearDown(self):
+		self._server.shutdown()
+		self._server.server_close()
+		self._temp_dir.cleanup()
+
+	def _scrap(self):
+		base_url = f"http://127.0.0.1:{self._server.server_port}"
+		scrapper = BaseRoumen(Source.ROUMEN, self._settings, _RoumenSettings(
+			base_url=f"{base_url}/",
+			base_url_params={},
+			img_base=f"{base_url}/upload",
+			href_needle="roumingShow.php",
+		))
+		return scrapper.scrap()
+
+	def _item_name(self, result_item):
+		if result_item.status == ResultItemStatus.SUCCEEDED:
+			return result_item.success_info.relative_file_path.name
+		return result_item.error_info.item_to_download
+
+	def test_results_in_submission_order(self):
+		result = self._scrap()
+
+		self.assertEqual(result.general_error_list, [])
+		self.assertEqual([self._item_name(item) for item in result.items], _SUBMITTED_IMAGES)
+
+		with sqlite3.connect(self._sqlite_datafile) as db_conn:
+			stored_names = [row[0] for row in db_conn.execute("select name from scrap_items order by scrap_item_id")]
+		self.assertEqual(stored_names, [name for name in _SUBMITTED_IMAGES if name != _MISSING_IMAGE])
+
+	def test_retryable_statuses_are_retried(self):
+		result = self._scrap()
+
+		for name, statuses in _IMAGE_FAILURES.items():
+			self.assertEqual(self._server.requests.count(name), len(statuses) + 1, name)
+		self.assertEqual(result.items_succeeded_count, len(_IMAGE_FAILURES))
+		for name in _IMAGE_FAILURES.keys():
+			stored_file = next((self._settings.scrap_path / Source.ROUMEN.value).glob(f"*/*/{name}"))
+			self.assertEqual(stored_file.read_bytes(), f"content of {name}".encode("utf-8"))
+
+	def test_failed_image_does_not_abort_scrap(self):
+		result = self._scrap()
+
+		self.assertEqual(result.general_error_list, [])
+		self.assertEqual(result.items_failed_count, 1)
+		self.assertEqual(result.items_failed[0].error_info.item_to_download, _MISSING_IMAGE)
+		self.assertEqual(self._server.requests.count(_MISSING_IMAGE), 1)
+
+		with sqlite3.connect(self._sqlite_datafile) as db_conn:
+			failed_names = [row[0] for row in db_conn.execute("select item_name from scrap_fails")]
+			scrap_states = [row[0] for row in db_conn.execute("select status from scrap_stat")]
+		self.assertEqual(failed_names, [_MISSING_IMAGE])
+		self.assertEqual(scrap_states, ["complete"])
+
+
+if __name__ == "__main__":
+	unittest.main()
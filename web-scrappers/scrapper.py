@@ -1,9 +1,11 @@
-from flask import Flask, url_for, render_template, request
-import sys, typing, traceback
+from flask import Flask, url_for, render_template, request, redirect, abort, make_response, send_file
+import sys, os, typing, traceback
+import threading
 import random
 import sqlite3
 from pathlib import Path
 import scrappers
+from scrappers.util import formatters
 
 
 SETTINGS = {
@@ -21,8 +23,39 @@ SETTINGS = {
 	"limits": {
 		"images_shown": 100,
 		"scraps_shown": 100,
+		"stats_days_shown": 30,
+	},
+	"thumbnails": {
+		"enabled": True,
+		"relative-path": "static/thumbnails",
+		"timeout-seconds": 30,
+		"max-age-seconds": 30 * 24 * 3600,
+	},
+	"impressions": {
+		"enabled": True,
+		"flush-seconds": 10,
+	},
+	"cache": {
+		"enabled": True,
+		"max-entries": 64,
+		"ttl-seconds": 300,
 	},
 	"scrap": {
+		"workers": 4,
+		"job-refresh-seconds": 2,
+		"keep-result-items": True,
+		"result-log-path": None,
+		"requests-per-second": 2.0,
+		"requests-burst": 4,
+		# periodic scraps (of the sources with an interval), started with the application
+		"periodic": {
+			"enabled": True,
+			"jitter": 0.1,
+			"interval-seconds": {
+				"roumen": 3600,
+				"roumen-maso": 3600,
+			},
+		},
 		"auth-key": "wewewe",
 		"auth-error-messages": [
 			"You don't know the auth key. Do not mess with me!",
@@ -42,6 +75,17 @@ SETTINGS = {
 app = Flask(__name__)
 app.debug = SETTINGS["flask"]["debug"]
 
+page_cache = scrappers.PageCache(SETTINGS["cache"]["max-entries"], SETTINGS["cache"]["ttl-seconds"])
+
+# pages of the source (and the stats, cached with no source) change only when its scrap is finished
+scrappers.DbScrapWriter.add_finish_listener(SETTINGS["sqlite3"]["datafile"], lambda source: page_cache.invalidate(lambda key: key[1] in (source, None)))
+
+# impressions are counted in memory and written in batches, not by every view (flushing is started by start_background_tasks())
+impression_counter = scrappers.ImpressionCounter(scrappers.DbScrapItems.create(SETTINGS["sqlite3"]["datafile"]), SETTINGS["impressions"]["flush-seconds"])
+
+# item ids of the last rendered gallery page by the source, cached pages count their impressions by them
+page_view_item_ids = dict()
+
 
 def get_page_data(page_values: dict=None):
 	HTML_ENTITY_SYMBOL_HOME = "&#x2302;"
@@ -54,7 +98,7 @@ def get_page_data(page_values: dict=None):
 			"less": url_for("static", filename="site.less"),
 		},
 		"current": {
-			"endpoint": None if request.endpoint is None else url_for(request.endpoint, **page_values if page_values is not None else {}),
+			"endpoint": None if request.endpoint is None else url_for(request.endpoint, **page_values if page_values is not None else request.view_args or {}),
 			"image_dir": url_for("static", filename="images") + "/",
 			"debug": SETTINGS["flask"]["debug"],
 		},
@@ -75,6 +119,21 @@ def get_page_data(page_values: dict=None):
 	return page_data
 
 
+def render_cached(cache_key:tuple, render_cb:callable):
+	"""
+	Renders the page by {render_cb}() or takes it from the page cache.
+	Response carries the ETag of the page, so the browser revalidates it and unchanged page is answered by 304.
+	"""
+	if not SETTINGS["cache"]["enabled"]:
+		return render_cb()
+
+	content, etag = page_cache.get_or_render(cache_key, render_cb)
+	response = make_response(content)
+	response.set_etag(etag)
+	response.headers["Cache-Control"] = "no-cache"
+	return response.make_conditional(request)
+
+
 @app.route("/")
 def page_index():
 	return render_template("home.html", page_data=get_page_data())
@@ -87,13 +146,16 @@ def page_griffin():
 
 @app.route("/stats/")
 def page_stats():
-	page_data = get_page_data()
-	reader = scrappers.DbStatReader.create(SETTINGS["sqlite3"]["datafile"])
-	page_data["stats"] = {
-		"last_scraps": reader.read_last_scraps(SETTINGS["limits"]["scraps_shown"]),
-	}
+	def _render():
+		page_data = get_page_data()
+		reader = scrappers.DbStatReader.create(SETTINGS["sqlite3"]["datafile"])
+		page_data["stats"] = {
+			"daily": reader.read_daily_stats(SETTINGS["limits"]["stats_days_shown"]),
+			"last_scraps": reader.read_last_scraps(SETTINGS["limits"]["scraps_shown"]),
+		}
+		return render_template("stats.html", page_data=page_data)
 
-	return render_template("stats.html", page_data=page_data)
+	return render_cached(("page_stats", None, SETTINGS["limits"]["scraps_shown"], SETTINGS["limits"]["stats_days_shown"]), _render)
 
 
 @app.route("/scrap/", methods=["GET"])
@@ -109,7 +171,12 @@ def page_scrap():
 
 		if request.method == "GET" and "auth-key" in request.args.keys():
 			if SETTINGS["scrap"]["auth-key"] == request.args.get("auth-key"):
-				page_data["scrapper_results"] = {s: scrap(s) for s in scrappers.Source if s is not scrappers.Source.NOOP}
+				sources = [s for s in scrappers.registry.registered_sources() if s is not scrappers.Source.NOOP]
+				if "async" in request.args.keys():
+					# the scrap goes on in background, the job page is polled for the progress
+					job = get_scheduler().submit(sources)
+					return redirect(url_for("page_scrap_job", job_id=job.job_id))
+				page_data["scrapper_results"] = get_scheduler().scrap_all(sources)
 			else:
 				page_data["auth_error"] = {
 					"title": "Authentication error",
@@ -121,17 +188,119 @@ def page_scrap():
 	return render_template("scrap.html", page_data=page_data)
 
 
+@app.route("/scrap/job/<job_id>/")
+def page_scrap_job(job_id):
+	job = get_scheduler().get_job(job_id)
+	if job is None:
+		abort(404)
+
+	page_data = get_page_data({"job_id": job_id})
+	try:
+		page_data["job"] = {
+			"id": job.job_id,
+			"state": job.state.value,
+			"finished": job.is_finished,
+			"refresh_seconds": SETTINGS["scrap"]["job-refresh-seconds"],
+			"ts_start": formatters.ts_to_str(formatters.TIMESTAMP_FORMAT.DATETIME, job.ts_start),
+			"ts_end": formatters.NOT_AVAILABLE_STR if job.ts_end is None else formatters.ts_to_str(formatters.TIMESTAMP_FORMAT.DATETIME, job.ts_end),
+			"sources": [{"name": s.value, "state": job.source_state(s).value} for s in job.sources],
+		}
+		page_data["scrapper_results"] = job.results
+	except:
+		return render_exception_page(page_data=page_data)
+
+	return render_template("scrap_job.html", page_data=page_data)
+
+
+def get_image_page(source:str, limit:int, cursor:str=None):
+	"""
+	:return: tuple (list of images, url of the next page or None)
+	"""
+	reader = scrappers.DbScrapReader.create(SETTINGS["sqlite3"]["datafile"], scrappers.Source.of(source))
+	images, next_cursor = reader.read_items_page(limit, cursor)
+	for image in images:
+		image["image_url"] = url_for("static", filename=f"images/{image['local_path']}")
+		image["thumbnail_url"] = url_for("page_thumbnail", scrap_item_id=image["scrap_item_id"])
+
+	next_url = None if next_cursor is None else url_for("page_view_items", source=source, cursor=next_cursor, limit=limit)
+	return images, next_url
+
+
 @app.route("/view/<source>/")
 def page_view(source):
+	# unknown sources are not rendered (nor cached)
+	if scrappers.Source.of(source) is scrappers.Source.NOOP:
+		abort(404)
+
 	page_data = get_page_data({"source": source})
 	try:
-		reader = scrappers.DbScrapReader.create(SETTINGS["sqlite3"]["datafile"], scrappers.Source.of(source))
-		page_data["images"] = reader.read_recent_items(SETTINGS["limits"]["images_shown"])
-		return render_template("view.html", page_data=page_data)
+		def _render():
+			page_data["images"], page_data["next_images_url"] = get_image_page(source, SETTINGS["limits"]["images_shown"])
+			page_view_item_ids[source] = [image["scrap_item_id"] for image in page_data["images"]]
+			return render_template("view.html", page_data=page_data)
+
+		response = render_cached(("page_view", source, SETTINGS["limits"]["images_shown"]), _render)
+		if SETTINGS["impressions"]["enabled"]:
+			impression_counter.add(page_view_item_ids.get(source, list()))
+		return response
 	except:
 		return render_exception_page(page_data=page_data)
 
 
+@app.route("/view/<source>/items/")
+def page_view_items(source):
+	"""
+	Next pages of the gallery (json), they are seeked by the cursor from the previous page.
+	"""
+	if scrappers.Source.of(source) is scrappers.Source.NOOP:
+		abort(404)
+
+	try:
+		images, next_url = get_image_page(source, request.args.get("limit", SETTINGS["limits"]["images_shown"], type=int), request.args.get("cursor"))
+	except ValueError:
+		abort(400)
+
+	if SETTINGS["impressions"]["enabled"]:
+		impression_counter.add([image["scrap_item_id"] for image in images])
+
+	return {
+		"images": images,
+		"next_url": next_url,
+	}
+
+
+@app.route("/thumb/<int:scrap_item_id>/")
+def page_thumbnail(scrap_item_id):
+	"""
+	Thumbnail of the item, created on the first request when the scrap did not create it.
+	Original image is served, when the thumbnail cannot be created.
+	"""
+	items = scrappers.DbScrapItems.create(SETTINGS["sqlite3"]["datafile"])
+	item = items.read_item(scrap_item_id)
+	if item is None:
+		abort(404)
+
+	settings = get_scrapper_settings()
+	original_file = settings.scrap_path / item["local_path"]
+	original_url = url_for("static", filename=f"images/{item['local_path']}")
+	if settings.thumbnail_path is None or not scrappers.thumbnails.is_supported() or not original_file.is_file():
+		return redirect(original_url)
+
+	try:
+		content_hash = item["content_hash"]
+		if content_hash is None:
+			content_hash = scrappers.thumbnails.file_content_hash(original_file)
+			items.write_content_hash(scrap_item_id, content_hash)
+
+		generator = scrappers.ThumbnailGenerator.get(settings.thumbnail_path)
+		thumbnail_file = generator.get_or_create(original_file, content_hash, SETTINGS["thumbnails"]["timeout-seconds"])
+	except:
+		return redirect(original_url)
+
+	# content of the item never changes
+	return send_file(thumbnail_file, mimetype=generator.mimetype, max_age=SETTINGS["thumbnails"]["max-age-seconds"])
+
+
 @app.errorhandler(404)
 def page_not_found(e):
 	page_data = get_page_data()
@@ -183,21 +352,66 @@ def fake_scrap(scrapper_source: scrappers.Source):
 	return r
 
 
-def scrap(scrapper_source: scrappers.Source):
-	scrapper_settings = scrappers.Settings(
+def get_scrapper_settings():
+	return scrappers.Settings(
 		local_base_path=Path.cwd(),
 		local_relative_path=Path("static").joinpath("images"),
 		sqlite_datafile=Path(SETTINGS["sqlite3"]["datafile"]),
+		thumbnail_relative_path=Path(SETTINGS["thumbnails"]["relative-path"]) if SETTINGS["thumbnails"]["enabled"] else None,
+		keep_result_items=SETTINGS["scrap"]["keep-result-items"],
+		result_log_path=None if SETTINGS["scrap"]["result-log-path"] is None else Path(SETTINGS["scrap"]["result-log-path"]),
+		requests_per_second=SETTINGS["scrap"]["requests-per-second"],
+		requests_burst=SETTINGS["scrap"]["requests-burst"],
 		)
 
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+	global _scheduler
+	with _scheduler_lock:
+		if _scheduler is None:
+			_scheduler = scrappers.ScrapScheduler(get_scrapper_settings(), max_workers=SETTINGS["scrap"]["workers"])
+		return _scheduler
+
+
+def scrap(scrapper_source: scrappers.Source):
 	scrapper = scrappers.create(
 		source=scrapper_source,
-		settings=scrapper_settings
+		settings=get_scrapper_settings()
 		)
 
 	scrap_result = scrapper.scrap()
 	return scrap_result
 
 
+def start_periodic_scheduler():
+	periodic_settings = SETTINGS["scrap"]["periodic"]
+	intervals = {scrappers.Source.of(k): v for (k, v) in periodic_settings["interval-seconds"].items()}
+	periodic_scheduler = scrappers.PeriodicScrapScheduler(
+		get_scheduler(),
+		Path(SETTINGS["sqlite3"]["datafile"]),
+		{s: v for (s, v) in intervals.items() if s is not scrappers.Source.NOOP},
+		periodic_settings["jitter"],
+		)
+	periodic_scheduler.start()
+	return periodic_scheduler
+
+
+def start_background_tasks():
+	"""
+	Flushing of the impressions and the periodic scraps. Not started on import, the module is imported
+	by the spawned thumbnail workers (and by the reloader parent process) as well.
+	"""
+	if SETTINGS["impressions"]["enabled"]:
+		impression_counter.start()
+	if SETTINGS["scrap"]["periodic"]["enabled"]:
+		start_periodic_scheduler()
+
+
 if __name__ == "__main__":
+	# with the debug reloader, the application runs in the child process only
+	if not app.debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+		start_background_tasks()
 	app.run(**SETTINGS["flask"])
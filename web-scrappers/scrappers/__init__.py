@@ -1,10 +1,15 @@
 __version__ = "v0.1"
-__all__ = [ "util", "sources", "settings", "result", "factory", "database", "install" ]
+__all__ = [ "util", "sources", "settings", "result", "factory", "database", "install", "scheduler", "page_cache", "thumbnails", "impressions", "registry", "ratelimit" ]
 
 from .util.exception_info import ExceptionInfo
 from .sources import Source
 from .settings import Settings
 from .result import Result
 from .factory import create
-from .database import DbScrapWriter, DbScrapReader, DbStatReader
+from .registry import register
+from .database import DbScrapWriter, DbScrapReader, DbStatReader, DbSourceState, DbScrapItems
 from .install import install
+from .scheduler import ScrapScheduler, ScrapJob, ScrapJobState, PeriodicScrapScheduler
+from .page_cache import PageCache
+from .thumbnails import ThumbnailGenerator
+from .impressions import ImpressionCounter
@@ -1,4 +1,4 @@
 __version__ = "v0.1"
 __all__ = [ "db_api" ]
 
-from .db_api import DbScrapWriter, DbScrapReader, DbStatReader
+from .db_api import DbScrapWriter, DbScrapReader, DbStatReader, DbSourceState, DbScrapItems
@@ -3,14 +3,20 @@ import sqlite3
 import datetime
 import enum
 import pathlib
-from ..util import exception_info, formatters
+import queue
+import threading
+import time
+from ..util import exception_info, formatters, histogram
 from ..sources import Source
+from ..install import install as install_database
 
 
 class _Tables(enum.Enum):
 	SCRAP_STAT = "scrap_stat"
 	SCRAP_FAILS = "scrap_fails"
 	SCRAP_ITEMS = "scrap_items"
+	SOURCE_STATE = "source_state"
+	SCRAP_DAILY_STATS = "scrap_daily_stats"
 
 
 class _ScrapState(enum.Enum):
@@ -20,13 +26,51 @@ class _ScrapState(enum.Enum):
 
 
 class _SqliteApi(object):
+	"""
+	SQLite access with a pool of persistent connections.
+	Instances are shared per datafile (see get()), so the Flask handlers and the scrappers reuse the same pool.
+	Connections are opened lazily (up to POOL_SIZE), they are not bound to the thread opening them,
+	but every connection is used by a single thread at a time.
+	"""
 
 	SELECT_LIMIT_MIN = 1
 	SELECT_LIMIT_MAX = 300
 	SELECT_LIMIT_FALLBACK = 10
 
-	def __init__(self, sqlite_datafile:pathlib.Path):
+	POOL_SIZE = 8
+	BUSY_TIMEOUT_MS = 5000
+	CACHED_STATEMENTS = 256
+	PRAGMAS = (
+		"pragma journal_mode=wal",
+		"pragma synchronous=normal",
+		"pragma temp_store=memory",
+		"pragma cache_size=-8192",
+		f"pragma busy_timeout={BUSY_TIMEOUT_MS}",
+	)
+
+	_instances = dict()
+	_instances_lock = threading.Lock()
+
+	@classmethod
+	def get(cls, sqlite_datafile:pathlib.Path):
+		key = str(pathlib.Path(sqlite_datafile).resolve())
+		with cls._instances_lock:
+			instance = cls._instances.get(key)
+			if instance is None:
+				instance = cls._instances[key] = cls(sqlite_datafile)
+			return instance
+
+	def __init__(self, sqlite_datafile:pathlib.Path, pool_size:int=POOL_SIZE):
 		self.sqlite_datafile = sqlite_datafile
+		self._pool_size = pool_size
+		self._pool = queue.LifoQueue()
+		self._pool_lock = threading.Lock()
+		self._opened_count = 0
+		self._closed = False
+		self._schema_installed = False
+		self._install_lock = threading.Lock()
+		# callbacks (source) called when a scrap record of this database is finished and committed
+		self.scrap_finish_listeners = list()
 
 	@staticmethod
 	def clamp_limit(limit_value:int):
@@ -41,13 +85,84 @@ class _SqliteApi(object):
 
 		return limit_value
 
+	def _open_connection(self):
+		# statements are cached per connection (by their sql text), so persistent connections reuse them
+		db_conn = sqlite3.connect(
+			self.sqlite_datafile,
+			timeout=_SqliteApi.BUSY_TIMEOUT_MS / 1000,
+			check_same_thread=False,
+			cached_statements=_SqliteApi.CACHED_STATEMENTS,
+		)
+		for pragma in _SqliteApi.PRAGMAS:
+			db_conn.execute(pragma)
+		histogram.register_sql_functions(db_conn)
+
+		# schema is created (or migrated) by the first connection, the others opened meanwhile wait for it
+		if not self._schema_installed:
+			with self._install_lock:
+				if not self._schema_installed:
+					with db_conn:
+						install_database(db_conn)
+					self._schema_installed = True
+
+		return db_conn
+
+	def _acquire_connection(self):
+		try:
+			return self._pool.get_nowait()
+		except queue.Empty:
+			pass
+
+		with self._pool_lock:
+			open_new = self._opened_count < self._pool_size
+			if open_new:
+				self._opened_count += 1
+
+		if not open_new:
+			return self._pool.get()
+
+		try:
+			return self._open_connection()
+		except:
+			with self._pool_lock:
+				self._opened_count -= 1
+			raise
+
+	def _release_connection(self, db_conn:sqlite3.Connection):
+		with self._pool_lock:
+			closed = self._closed
+			if closed:
+				self._opened_count -= 1
+
+		if closed:
+			db_conn.close()
+		else:
+			self._pool.put(db_conn)
+
+	def close(self):
+		"""
+		Closes the idle connections, connections in use are closed by their release
+		(connections are not pooled after the close).
+		"""
+		with self._pool_lock:
+			self._closed = True
+
+		while True:
+			try:
+				db_conn = self._pool.get_nowait()
+			except queue.Empty:
+				return
+			with self._pool_lock:
+				self._opened_count -= 1
+			db_conn.close()
+
 	def do_with_connection(self, connection_cb:callable):
-		db_conn = sqlite3.Connection(self.sqlite_datafile)
+		db_conn = self._acquire_connection()
 		try:
 			with db_conn:
 				return connection_cb(db_conn)
 		finally:
-			db_conn.close()
+			self._release_connection(db_conn)
 
 	def do_with_cursor(self, cursor_cb:callable):
 		def _cursor_call(connection):
@@ -87,29 +202,59 @@ class _SqliteApi(object):
 
 		return self.read(stmt, filter_map)
 
+	@staticmethod
+	def _insert_stmt(table_name, cols:list):
+		return f"insert into {table_name}({', '.join(cols)}) values (:{', :'.join(cols)})"
+
 	def write(self, table_name, value_mapping:dict):
 		def _writer(connection):
-			cols = list(value_mapping.keys())
-			sql_stmt = f"insert into {table_name}({', '.join(cols)}) values (:{', :'.join(cols)})"
-			connection.execute(sql_stmt, value_mapping)
+			sql_stmt = _SqliteApi._insert_stmt(table_name, list(value_mapping.keys()))
+			return connection.execute(sql_stmt, value_mapping).lastrowid
 
 		return self.do_with_connection(_writer)
 
-	def update(self, table_name, value_mapping:dict, where_condition_mapping:dict):
+	def replace(self, table_name, value_mapping:dict):
+		"""
+		Inserts the row or replaces the one with the same primary (or unique) key.
+		"""
 		def _writer(connection):
-			# rename all value_mapping keys to "new_{key}" and where_condition_mapping keys to "where_{key}"
-			# statement pattern:
-			# update table_name set col_a=:new_col_a, col_b=:new_col_b where col_c=:where_col_c and col_d=:where_col_d
-			stmt_set = ", ".join(map(lambda k: f"{k}=:new_{k}", value_mapping.keys()))
-			stmt_whr = " and ".join(map(lambda k: f"{k}=:where_{k}", where_condition_mapping.keys()))
-			sql_stmt = f"update {table_name} set {stmt_set} where {stmt_whr}"
-			connection.execute(sql_stmt, {
-				**{ f"new_{k}": v for (k, v) in value_mapping.items() },
-				**{ f"where_{k}": v for (k, v) in where_condition_mapping.items() }
-			})
+			sql_stmt = "insert or replace" + _SqliteApi._insert_stmt(table_name, list(value_mapping.keys()))[len("insert"):]
+			connection.execute(sql_stmt, value_mapping)
 
 		return self.do_with_connection(_writer)
 
+	@staticmethod
+	def write_many_with_connection(connection:sqlite3.Connection, table_name, value_mappings:list):
+		# mappings are grouped by their columns, every group is a single executemany
+		groups = dict()
+		for value_mapping in value_mappings:
+			groups.setdefault(tuple(value_mapping.keys()), list()).append(value_mapping)
+
+		for cols, group in groups.items():
+			connection.executemany(_SqliteApi._insert_stmt(table_name, list(cols)), group)
+
+	def write_many(self, table_name, value_mappings:list):
+		"""
+		Inserts all the rows in a single transaction.
+		"""
+		return self.do_with_connection(lambda connection: _SqliteApi.write_many_with_connection(connection, table_name, value_mappings))
+
+	@staticmethod
+	def update_with_connection(connection:sqlite3.Connection, table_name, value_mapping:dict, where_condition_mapping:dict):
+		# rename all value_mapping keys to "new_{key}" and where_condition_mapping keys to "where_{key}"
+		# statement pattern:
+		# update table_name set col_a=:new_col_a, col_b=:new_col_b where col_c=:where_col_c and col_d=:where_col_d
+		stmt_set = ", ".join(map(lambda k: f"{k}=:new_{k}", value_mapping.keys()))
+		stmt_whr = " and ".join(map(lambda k: f"{k}=:where_{k}", where_condition_mapping.keys()))
+		sql_stmt = f"update {table_name} set {stmt_set} where {stmt_whr}"
+		connection.execute(sql_stmt, {
+			**{ f"new_{k}": v for (k, v) in value_mapping.items() },
+			**{ f"where_{k}": v for (k, v) in where_condition_mapping.items() }
+		})
+
+	def update(self, table_name, value_mapping:dict, where_condition_mapping:dict):
+		return self.do_with_connection(lambda connection: _SqliteApi.update_with_connection(connection, table_name, value_mapping, where_condition_mapping))
+
 	def read_last_seq(self, table_name):
 		def _reader(cursor):
 			cursor.execute("select seq from sqlite_sequence where name=?", (table_name, ))
@@ -119,47 +264,114 @@ class _SqliteApi(object):
 
 
 class DbScrapWriter(object):
+	"""
+	Writes the scrap record and its items.
+
+	The scrap_stat record is written (as in_progress) right away. In the buffered mode, the items are collected
+	and written in a single transaction, when {flush_size} items are buffered, {flush_interval} seconds passed
+	since the last flush, or together with the scrap_stat update in finish() / finish_exceptionaly().
+	"""
+
+	FLUSH_SIZE = 100
+	FLUSH_INTERVAL = 5.0
+
+	@staticmethod
+	def add_finish_listener(sqlite_datafile:pathlib.Path, finish_cb:callable):
+		"""
+		{finish_cb}(source) is called when a scrap record of the database is finished and committed.
+		"""
+		_SqliteApi.get(sqlite_datafile).scrap_finish_listeners.append(finish_cb)
+
+	@staticmethod
+	def remove_finish_listener(sqlite_datafile:pathlib.Path, finish_cb:callable):
+		_SqliteApi.get(sqlite_datafile).scrap_finish_listeners.remove(finish_cb)
+
 	@classmethod
-	def create(cls, sqlite_datafile:pathlib.Path, source:Source):
-		return cls(_SqliteApi(sqlite_datafile), source.value)
+	def create(cls, sqlite_datafile:pathlib.Path, source:Source, buffered:bool=False):
+		return cls(_SqliteApi.get(sqlite_datafile), source.value, buffered)
 
-	def __init__(self, db_api:_SqliteApi, source:str):
+	def __init__(self, db_api:_SqliteApi, source:str, buffered:bool=False, flush_size:int=FLUSH_SIZE, flush_interval:float=FLUSH_INTERVAL):
 		self._db = db_api
 		self._source = source
+		self._buffered = buffered
+		self._flush_size = flush_size
+		self._flush_interval = flush_interval
+		self._buffer = list()
+		self._ts_last_flush = time.monotonic()
+		self._ts_start = None
 		self._scrap_stat_id = self._initialize_record()
 		self._item_succ_count = 0
 		self._item_fail_count = 0
+		self._bytes_downloaded = 0
+
+	def _write_item(self, table:_Tables, value_mapping:dict):
+		if not self._buffered:
+			self._db.write(table.value, value_mapping)
+			return
+
+		self._buffer.append((table, value_mapping))
+		if len(self._buffer) >= self._flush_size or time.monotonic() - self._ts_last_flush >= self._flush_interval:
+			self.flush()
+
+	def _flush_with_connection(self, connection:sqlite3.Connection):
+		for table in _Tables:
+			value_mappings = [value_mapping for (t, value_mapping) in self._buffer if t is table]
+			if len(value_mappings) > 0:
+				_SqliteApi.write_many_with_connection(connection, table.value, value_mappings)
+
+	def _on_flushed(self):
+		# the buffer is kept, when the transaction fails
+		self._buffer = list()
+		self._ts_last_flush = time.monotonic()
+
+	def flush(self):
+		if len(self._buffer) > 0:
+			self._db.do_with_connection(self._flush_with_connection)
+		self._on_flushed()
+
+	def _finish_record(self, value_mapping:dict):
+		def _writer(connection):
+			self._flush_with_connection(connection)
+			_SqliteApi.update_with_connection(connection, _Tables.SCRAP_STAT.value, value_mapping, {
+				"scrap_stat_id": self._scrap_stat_id,
+			})
+			DbDailyStats.update_with_connection(connection, self._source, self._ts_start, value_mapping)
+
+		self._db.do_with_connection(_writer)
+		self._on_flushed()
+
+		for finish_cb in list(self._db.scrap_finish_listeners):
+			finish_cb(self._source)
 
 	def _initialize_record(self):
-		ts_now = datetime.datetime.now()
-		self._db.write(_Tables.SCRAP_STAT.value, {
+		self._ts_start = formatters.ts_to_epoch_ms()
+		# row id of the insert itself, the sqlite_sequence could be already moved by another writer
+		return self._db.write(_Tables.SCRAP_STAT.value, {
 			"source": self._source,
-			"ts_start_date": formatters.ts_to_str(formatters.TIMESTAMP_FORMAT.DATE, ts_now),
-			"ts_start_time": formatters.ts_to_str(formatters.TIMESTAMP_FORMAT.TIME_MS, ts_now),
+			"ts_start": self._ts_start,
 			"status": _ScrapState.IN_PROGRESS.value,
 		})
-		return self._db.read_last_seq(_Tables.SCRAP_STAT.value)
 
-	def on_scrap_item_success(self, local_path:pathlib.Path, item_name:str):
+	def on_scrap_item_success(self, local_path:pathlib.Path, item_name:str, content_hash:str=None, content_length:int=0):
 		self._item_succ_count += 1
+		self._bytes_downloaded += content_length
 		ts_now = datetime.datetime.now()
-		self._db.write(_Tables.SCRAP_ITEMS.value, {
+		self._write_item(_Tables.SCRAP_ITEMS, {
 			"scrap_stat_id": self._scrap_stat_id,
-			"ts_date": formatters.ts_to_str(formatters.TIMESTAMP_FORMAT.DATE, ts_now),
-			"ts_week": formatters.ts_to_str(formatters.TIMESTAMP_FORMAT.WEEK, ts_now),
-			"ts_time": formatters.ts_to_str(formatters.TIMESTAMP_FORMAT.TIME_MS, ts_now),
+			"source": self._source,
+			"ts": formatters.ts_to_epoch_ms(ts_now),
 			"local_path": str(local_path).replace("\\", "/"),
 			"name": item_name,
 			"impressions": 0,
+			"content_hash": content_hash,
 		})
 
 	def on_scrap_item_failure(self, item_name:str, description:str, exception_info:exception_info.ExceptionInfo):
 		self._item_fail_count += 1
 		ts_now = datetime.datetime.now()
-		self._db.write(_Tables.SCRAP_FAILS.value, {
+		self._write_item(_Tables.SCRAP_FAILS, {
 			"scrap_stat_id": self._scrap_stat_id,
-			"ts_date": formatters.ts_to_str(formatters.TIMESTAMP_FORMAT.DATE, ts_now),
-			"ts_time": formatters.ts_to_str(formatters.TIMESTAMP_FORMAT.TIME_MS, ts_now),
+			"ts": formatters.ts_to_epoch_ms(ts_now),
 			"item_name": item_name,
 			"description": description,
 			"exc_type": str(exception_info.exception_type),
@@ -169,98 +381,287 @@ class DbScrapWriter(object):
 
 	def finish(self):
 		ts_now = datetime.datetime.now()
-		self._db.update(_Tables.SCRAP_STAT.value, {
-			"ts_end_date": formatters.ts_to_str(formatters.TIMESTAMP_FORMAT.DATE, ts_now),
-			"ts_end_time": formatters.ts_to_str(formatters.TIMESTAMP_FORMAT.TIME_MS, ts_now),
+		self._finish_record({
+			"ts_end": formatters.ts_to_epoch_ms(ts_now),
 			"status": _ScrapState.COMPLETE.value,
 			"succ_count": self._item_succ_count,
 			"fail_count": self._item_fail_count,
-		}, {
-			"scrap_stat_id": self._scrap_stat_id,
+			"bytes_downloaded": self._bytes_downloaded,
 		})
 
 	def finish_exceptionaly(self, exception_info:exception_info.ExceptionInfo):
 		ts_now = datetime.datetime.now()
-		self._db.update(_Tables.SCRAP_STAT.value, {
-			"ts_end_date": formatters.ts_to_str(formatters.TIMESTAMP_FORMAT.DATE, ts_now),
-			"ts_end_time": formatters.ts_to_str(formatters.TIMESTAMP_FORMAT.TIME_MS, ts_now),
+		self._finish_record({
+			"ts_end": formatters.ts_to_epoch_ms(ts_now),
 			"status": _ScrapState.FAILED.value,
 			"succ_count": self._item_succ_count,
 			"fail_count": self._item_fail_count,
+			"bytes_downloaded": self._bytes_downloaded,
 			"exc_type": str(exception_info.exception_type),
 			"exc_value": str(exception_info.value),
 			"exc_traceback": str(exception_info.formatted_exception),
-		}, {
-			"scrap_stat_id": self._scrap_stat_id,
 		})
 
 
 class DbScrapReader(object):
 	@classmethod
 	def create(cls, sqlite_datafile:pathlib.Path, source:Source):
-		return cls(_SqliteApi(sqlite_datafile), source.value)
+		return cls(_SqliteApi.get(sqlite_datafile), source.value)
 
 	def __init__(self, db_api:_SqliteApi, source:str):
 		self._db = db_api
 		self._source = source
 
 	def read_recent_items(self, item_limit:int):
+		return self.read_items_page(item_limit)[0]
+
+	@staticmethod
+	def format_cursor(ts:int, scrap_item_id:int):
+		return f"{ts}.{scrap_item_id}"
+
+	@staticmethod
+	def parse_cursor(cursor:str):
+		"""
+		:return: tuple (ts, scrap_item_id)
+		:raise ValueError: for malformed cursor
+		"""
+		ts, scrap_item_id = cursor.split(".")
+		return int(ts), int(scrap_item_id)
+
+	def read_items_page(self, item_limit:int, cursor:str=None):
+		"""
+		Page of the items, newest first. Pages are seeked by the (ts, scrap_item_id) of the last item of the previous page
+		in the index, so any page costs the same as the first one.
+
+		:param cursor: cursor of the previous page (None for the first page)
+		:return: tuple (list of items, cursor of the next page or None for the last page)
+		"""
+		ts_now = datetime.datetime.now()
+
 		def _row_mapper(r):
-			scrap_ts = formatters.str_to_ts(formatters.TIMESTAMP_FORMAT.DATETIME_MS, f"{r[0]} {r[1]}")
+			scrap_ts = formatters.epoch_ms_to_ts(r[0])
 			return {
 				"datetime": formatters.ts_to_str(formatters.TIMESTAMP_FORMAT.DATETIME, scrap_ts),
-				"age": formatters.ts_diff_to_str(scrap_ts, datetime.datetime.now(), False),
-				"name": r[2],
-				"local_path": r[3],
-				"impressions": r[4],
+				"age": formatters.ts_diff_to_str(scrap_ts, ts_now, False),
+				"name": r[1],
+				"local_path": r[2],
+				"impressions": r[3],
+				"scrap_item_id": r[4],
+				"ts": r[0],
 			}
 
-		stmt = f"""
-			select ts_date, ts_time, name, local_path, impressions
-			from {_Tables.SCRAP_ITEMS.value}
-			inner join {_Tables.SCRAP_STAT.value}
-				on {_Tables.SCRAP_STAT.value}.scrap_stat_id={_Tables.SCRAP_ITEMS.value}.scrap_stat_id
-			where source=:source
-			order by ts_date desc, ts_time desc
-			limit :limit"""
-
 		binds = {
 			"source": self._source,
 			"limit": _SqliteApi.clamp_limit(item_limit)
 		}
 
-		return self._db.read(stmt, binds, _row_mapper)
+		seek_condition = ""
+		if cursor is not None:
+			binds["cursor_ts"], binds["cursor_id"] = DbScrapReader.parse_cursor(cursor)
+			seek_condition = "and (ts, scrap_item_id) < (:cursor_ts, :cursor_id)"
+
+		# served by the covering index ix_scrap_items_source_ts_id
+		stmt = f"""
+			select ts, name, local_path, impressions, scrap_item_id
+			from {_Tables.SCRAP_ITEMS.value}
+			where source=:source {seek_condition}
+			order by ts desc, scrap_item_id desc
+			limit :limit"""
+
+		items = self._db.read(stmt, binds, _row_mapper)
+		if len(items) < binds["limit"]:
+			return items, None
 
-	def read_recent_item_names(self):
+		return items, DbScrapReader.format_cursor(items[-1]["ts"], items[-1]["scrap_item_id"])
+
+	RECENT_DAYS = 183
+
+	@staticmethod
+	def _recent_ts_since():
+		return formatters.ts_to_epoch_ms(datetime.datetime.now() - datetime.timedelta(days=DbScrapReader.RECENT_DAYS))
+
+	# stays well below the sqlite limit of the bound variables
+	EXISTING_NAMES_CHUNK_SIZE = 500
+
+	def read_existing_item_names(self, item_names:list):
+		"""
+		Which of the names are stored (for the source, in the last 6 months).
+		Every name is looked up by the (source, name) index, so the cost does not grow with the archive.
+
+		:return: set of the stored names
+		"""
+		item_names = list(set(item_names))
+		existing_names = set()
+		ts_since = DbScrapReader._recent_ts_since()
+
+		for i in range(0, len(item_names), DbScrapReader.EXISTING_NAMES_CHUNK_SIZE):
+			chunk = item_names[i:i + DbScrapReader.EXISTING_NAMES_CHUNK_SIZE]
+			binds = {f"name_{n}": name for (n, name) in enumerate(chunk)}
+			stmt = f"""
+				select distinct name
+				from {_Tables.SCRAP_ITEMS.value}
+				where source=:source and name in (:{', :'.join(binds.keys())}) and ts > :ts_since
+				"""
+			existing_names.update(self._db.read(stmt, {"source": self._source, "ts_since": ts_since, **binds}, lambda r: r[0]))
+
+		return existing_names
+
+	def read_local_path_by_content_hash(self, content_hash:str):
+		"""
+		:return: local path of the first item with the content hash (of any source) or None
+		"""
 		stmt = f"""
-			select distinct name
+			select local_path
 			from {_Tables.SCRAP_ITEMS.value}
-			inner join {_Tables.SCRAP_STAT.value}
-				on {_Tables.SCRAP_STAT.value}.scrap_stat_id={_Tables.SCRAP_ITEMS.value}.scrap_stat_id
-			where source=:source and scrap_items.ts_date > date('now', '-6 month')
+			where content_hash=:content_hash
+			order by scrap_item_id
+			limit 1
 			"""
 
-		binds = {
+		rows = self._db.read(stmt, {"content_hash": content_hash}, lambda r: r[0])
+		return rows[0] if len(rows) > 0 else None
+
+
+class DbScrapItems(object):
+	"""
+	Access to the single items by their id (of any source).
+	"""
+
+	@classmethod
+	def create(cls, sqlite_datafile:pathlib.Path):
+		return cls(_SqliteApi.get(sqlite_datafile))
+
+	def __init__(self, db_api:_SqliteApi):
+		self._db = db_api
+
+	def read_item(self, scrap_item_id:int):
+		"""
+		:return: dict with "source", "local_path" and "content_hash" or None for unknown item
+		"""
+		stmt = f"""
+			select source, local_path, content_hash
+			from {_Tables.SCRAP_ITEMS.value}
+			where scrap_item_id=:scrap_item_id
+			"""
+
+		rows = self._db.read(stmt, {"scrap_item_id": scrap_item_id}, lambda r: {
+			"source": r[0],
+			"local_path": r[1],
+			"content_hash": r[2],
+		})
+		return rows[0] if len(rows) > 0 else None
+
+	def write_content_hash(self, scrap_item_id:int, content_hash:str):
+		"""
+		Items stored before the content hashing get their hash later.
+		"""
+		self._db.update(_Tables.SCRAP_ITEMS.value, {"content_hash": content_hash}, {"scrap_item_id": scrap_item_id})
+
+	def add_impressions(self, increments:dict):
+		"""
+		Adds the impressions of all the items in a single transaction.
+
+		:param increments: impressions count by the item id
+		"""
+		stmt = f"update {_Tables.SCRAP_ITEMS.value} set impressions=coalesce(impressions, 0) + ? where scrap_item_id=?"
+		self._db.do_with_connection(lambda connection: connection.executemany(stmt, [(count, scrap_item_id) for (scrap_item_id, count) in increments.items()]))
+
+
+class DbSourceState(object):
+	"""
+	Validators (etag, last modified) and the body hash of the last scrapped listing page of the source.
+	"""
+
+	@classmethod
+	def create(cls, sqlite_datafile:pathlib.Path, source:Source):
+		return cls(_SqliteApi.get(sqlite_datafile), source.value)
+
+	def __init__(self, db_api:_SqliteApi, source:str):
+		self._db = db_api
+		self._source = source
+
+	def read(self):
+		"""
+		:return: dict with "etag", "last_modified" and "body_hash" (empty for unknown source)
+		"""
+		stmt = f"""
+			select etag, last_modified, body_hash
+			from {_Tables.SOURCE_STATE.value}
+			where source=:source
+			"""
+
+		rows = self._db.read(stmt, {"source": self._source}, lambda r: {
+			"etag": r[0],
+			"last_modified": r[1],
+			"body_hash": r[2],
+		})
+		return rows[0] if len(rows) > 0 else dict()
+
+	def write(self, etag:str, last_modified:str, body_hash:str):
+		ts_now = datetime.datetime.now()
+		self._db.replace(_Tables.SOURCE_STATE.value, {
 			"source": self._source,
+			"etag": etag,
+			"last_modified": last_modified,
+			"body_hash": body_hash,
+			"ts": formatters.ts_to_epoch_ms(ts_now),
+		})
+
+
+class DbDailyStats(object):
+	"""
+	Daily rollups of the finished scraps per source (day of the scrap start).
+	"""
+
+	@staticmethod
+	def update_with_connection(connection:sqlite3.Connection, source:str, ts_start:int, finish_mapping:dict):
+		"""
+		Adds the finished scrap to the rollup of its day (in the transaction of the finish).
+
+		:param finish_mapping: scrap_stat values written by the finish
+		"""
+		binds = {
+			"source": source,
+			"ts_start": ts_start,
+			"failed": 1 if finish_mapping["status"] == _ScrapState.FAILED.value else 0,
+			"succ_count": finish_mapping["succ_count"],
+			"fail_count": finish_mapping["fail_count"],
+			"bytes_downloaded": finish_mapping["bytes_downloaded"],
+			"duration_ms": finish_mapping["ts_end"] - ts_start,
 		}
 
-		return self._db.read(stmt, binds, lambda r: r[0])
+		connection.execute(f"""
+			insert into {_Tables.SCRAP_DAILY_STATS.value}
+				(day, source, scrap_count, failed_scrap_count, succ_count, fail_count, bytes_downloaded, duration_histogram)
+			values
+				(date(:ts_start / 1000, 'unixepoch', 'localtime'), :source, 1, :failed, :succ_count, :fail_count, :bytes_downloaded, histogram_add(null, :duration_ms))
+			on conflict(day, source) do update set
+				scrap_count=scrap_count + 1,
+				failed_scrap_count=failed_scrap_count + :failed,
+				succ_count=succ_count + :succ_count,
+				fail_count=fail_count + :fail_count,
+				bytes_downloaded=bytes_downloaded + :bytes_downloaded,
+				duration_histogram=histogram_add(duration_histogram, :duration_ms)""", binds)
+
+		connection.execute(f"""
+			update {_Tables.SCRAP_DAILY_STATS.value}
+			set duration_p50_ms=histogram_percentile(duration_histogram, 0.5), duration_p95_ms=histogram_percentile(duration_histogram, 0.95)
+			where day=date(:ts_start / 1000, 'unixepoch', 'localtime') and source=:source""", binds)
 
 
 class DbStatReader(object):
 	@classmethod
 	def create(cls, sqlite_datafile:pathlib.Path):
-		return cls(_SqliteApi(sqlite_datafile))
+		return cls(_SqliteApi.get(sqlite_datafile))
 
 	def __init__(self, db_api:_SqliteApi):
 		self._db = db_api
 
 	def read_last_scraps(self, record_limit:int):
-		def _to_ts_safe(date_string, time_string):
-			try:
-				return formatters.str_to_ts(formatters.TIMESTAMP_FORMAT.DATETIME_MS, f"{date_string} {time_string}")
-			except:
-				return None
+		ts_now = datetime.datetime.now()
+
+		def _to_ts_safe(epoch_ms):
+			return None if epoch_ms is None else formatters.epoch_ms_to_ts(epoch_ms)
 
 		def _percent_str_safe(succ_count, fail_count):
 			try:
@@ -269,22 +670,22 @@ class DbStatReader(object):
 				return formatters.NOT_AVAILABLE_STR
 
 		def _mapper(row):
-			scrap_s = _to_ts_safe(*row[3:5])
-			scrap_e = _to_ts_safe(*row[5:7])
+			scrap_s = _to_ts_safe(row[3])
+			scrap_e = _to_ts_safe(row[4])
 			return {
 				"scrap_id": row[0],
 				"source": row[1],
 				"status": row[2],
 				"ts_start": formatters.NOT_AVAILABLE_STR if scrap_s is None else formatters.ts_to_str(formatters.TIMESTAMP_FORMAT.DATETIME, scrap_s),
 				"ts_end": formatters.NOT_AVAILABLE_STR if scrap_e is None else formatters.ts_to_str(formatters.TIMESTAMP_FORMAT.DATETIME, scrap_e),
-				"age": formatters.NOT_AVAILABLE_STR if scrap_s is None else formatters.ts_diff_to_str(scrap_s, datetime.datetime.now(), False),
+				"age": formatters.NOT_AVAILABLE_STR if scrap_s is None else formatters.ts_diff_to_str(scrap_s, ts_now, False),
 				"time_taken": formatters.NOT_AVAILABLE_STR if None in (scrap_s, scrap_e) else formatters.ts_diff_to_str(scrap_s, scrap_e, False),
-				"count_succ": row[7],
-				"count_fail": row[8],
-				"succ_percentage": _percent_str_safe(row[7], row[8]),
-				"exc_type": row[9],
-				"exc_value": row[10],
-				"exc_traceback": row[11],
+				"count_succ": row[5],
+				"count_fail": row[6],
+				"succ_percentage": _percent_str_safe(row[5], row[6]),
+				"exc_type": row[7],
+				"exc_value": row[8],
+				"exc_traceback": row[9],
 			}
 
 		stmt = f"""
@@ -292,10 +693,8 @@ class DbStatReader(object):
 				{_Tables.SCRAP_STAT.value}_id,
 				source,
 				status,
-				ts_start_date,
-				ts_start_time,
-				ts_end_date,
-				ts_end_time,
+				ts_start,
+				ts_end,
 				succ_count,
 				fail_count,
 				exc_type,
@@ -311,4 +710,49 @@ class DbStatReader(object):
 		}
 
 		return self._db.read(stmt, binds, _mapper)
-		
+
+	def read_last_scrap_starts(self):
+		"""
+		:return: dict of the last scrap start (epoch ms) by the source
+		"""
+		stmt = f"""
+			select source, max(ts_start)
+			from {_Tables.SCRAP_STAT.value}
+			group by source
+			"""
+
+		return dict(self._db.read(stmt, dict()))
+
+	def read_daily_stats(self, day_count:int):
+		"""
+		Rollups of the last {day_count} days (newest first), read by the primary key range.
+		"""
+		def _duration_str_safe(duration_ms):
+			return formatters.NOT_AVAILABLE_STR if duration_ms is None else formatters.td_format(datetime.timedelta(milliseconds=duration_ms), duration_ms < 60000)
+
+		def _mapper(row):
+			return {
+				"day": row[0],
+				"source": row[1],
+				"scrap_count": row[2],
+				"failed_scrap_count": row[3],
+				"count_succ": row[4],
+				"count_fail": row[5],
+				"succ_percentage": formatters.percentage_str(row[4], row[4] + row[5]),
+				"bytes_downloaded": formatters.size_to_str(row[6]),
+				"duration_p50": _duration_str_safe(row[7]),
+				"duration_p95": _duration_str_safe(row[8]),
+			}
+
+		stmt = f"""
+			select day, source, scrap_count, failed_scrap_count, succ_count, fail_count, bytes_downloaded, duration_p50_ms, duration_p95_ms
+			from {_Tables.SCRAP_DAILY_STATS.value}
+			where day >= :day_since
+			order by day desc, source
+			"""
+
+		binds = {
+			"day_since": formatters.ts_to_str(formatters.TIMESTAMP_FORMAT.DATE, datetime.datetime.now() - datetime.timedelta(days=day_count - 1)),
+		}
+
+		return self._db.read(stmt, binds, _mapper)
@@ -1,14 +1,9 @@
 from .sources import Source
 from .settings import Settings
-from .impl import Noop, Roumen, RoumenMaso
+from .impl import Noop
+from . import registry
 
 
 def create(source:Source, settings:Settings):
-	scrapper_classes = {
-		Source.NOOP: Noop,
-		Source.ROUMEN: Roumen,
-		Source.ROUMEN_MASO: RoumenMaso,
-	}
-
-	scrapper_class = scrapper_classes.get(source, Noop)
+	scrapper_class = registry.get_class(source) or Noop
 	return scrapper_class(settings)
@@ -1,7 +1,9 @@
 from ..sources import Source
 from ..settings import Settings
 from ..result import Result
+from ..registry import register
 
+@register(Source.NOOP)
 class Noop(object):
 	def __init__(self, settings: Settings):
 		pass
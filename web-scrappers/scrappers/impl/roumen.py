@@ -1,11 +1,19 @@
 import sys, typing, traceback
 import datetime, os, pathlib
-import requests, urllib, bs4
+import requests, urllib
+import concurrent.futures
+import hashlib
+import html.parser
+import requests.adapters
+import urllib3.util.retry
 import sqlite3
 from ..sources import Source
 from ..settings import Settings
-from ..result import Result, ResultItem, ExceptionInfo
-from ..database import DbScrapWriter, DbScrapReader
+from ..result import Result, ResultItem, ExceptionInfo, JsonlResultSink
+from ..database import DbScrapWriter, DbScrapReader, DbSourceState
+from .. import thumbnails
+from ..registry import register
+from ..ratelimit import HostRateLimiter
 
 
 class _RoumenSettings(object):
@@ -16,6 +24,43 @@ class _RoumenSettings(object):
 		self.href_needle = href_needle
 
 
+class _HrefExtractor(html.parser.HTMLParser):
+	"""
+	Collects "href" values of all the "a" tags, nothing else of the page is kept.
+	"""
+
+	def __init__(self):
+		super().__init__(convert_charrefs=True)
+		self.hrefs = list()
+
+	def handle_starttag(self, tag, attrs):
+		if tag == "a":
+			for name, value in attrs:
+				if name == "href" and value is not None:
+					self.hrefs.append(value)
+
+	@classmethod
+	def extract(cls, page:str):
+		extractor = cls()
+		extractor.feed(page)
+		extractor.close()
+		return extractor.hrefs
+
+
+class _RateLimitedAdapter(requests.adapters.HTTPAdapter):
+	"""
+	Every request waits for a token of its host (retries of the request are not counted).
+	"""
+
+	def __init__(self, rate_limiter:HostRateLimiter, **kwargs):
+		super().__init__(**kwargs)
+		self._rate_limiter = rate_limiter
+
+	def send(self, request, *args, **kwargs):
+		self._rate_limiter.acquire(request.url)
+		return super().send(request, *args, **kwargs)
+
+
 class BaseRoumen(object):
 
 	REQUEST_HEADERS = {
@@ -27,70 +72,221 @@ class BaseRoumen(object):
 		self._source = source
 		self._roumen_settings = roumen_settings
 
+	DOWNLOAD_CHUNK_SIZE = 64 * 1024
+	RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+	def _create_session(self):
+		"""
+		Keep-alive session shared by all the downloads of the scrap.
+		Connections per host are limited to the number of download workers (pool_block waits for a free one),
+		failed connections and retryable statuses are retried with an exponential backoff.
+		Requests per host are rate limited, when the settings have the limit.
+		"""
+		retry = urllib3.util.retry.Retry(
+			total=self._settings.download_retries,
+			backoff_factor=self._settings.download_backoff,
+			status_forcelist=BaseRoumen.RETRY_STATUS_CODES,
+			allowed_methods=["GET"],
+		)
+		adapter_kwargs = {
+			"pool_connections": 2,
+			"pool_maxsize": self._settings.download_workers,
+			"pool_block": True,
+			"max_retries": retry,
+		}
+		if self._settings.requests_per_second is None:
+			adapter = requests.adapters.HTTPAdapter(**adapter_kwargs)
+		else:
+			rate_limiter = HostRateLimiter.get(self._settings.requests_per_second, self._settings.requests_burst)
+			adapter = _RateLimitedAdapter(rate_limiter, **adapter_kwargs)
+		session = requests.Session()
+		session.headers.update(BaseRoumen.REQUEST_HEADERS)
+		session.mount("http://", adapter)
+		session.mount("https://", adapter)
+		return session
+
+	PARTIAL_DOWNLOAD_SUFFIX = ".part"
+	CONTENT_HASH = "sha256"
+
+	def _download(self, session:requests.Session, remote_file_url:str, local_file_path:pathlib.Path):
+		"""
+		Streams the file to "{local_file_path}.part", hashing the content on the fly.
+
+		:return: tuple (partial file path, content hash, content length)
+		"""
+		partial_file_path = local_file_path.with_name(local_file_path.name + BaseRoumen.PARTIAL_DOWNLOAD_SUFFIX)
+		content_hash = hashlib.new(BaseRoumen.CONTENT_HASH)
+		content_length = 0
+		try:
+			with session.get(remote_file_url, stream=True, timeout=self._settings.download_timeout) as r:
+				r.raise_for_status()
+				with open(partial_file_path, "wb") as f:
+					for chunk in r.iter_content(chunk_size=BaseRoumen.DOWNLOAD_CHUNK_SIZE):
+						content_hash.update(chunk)
+						content_length += len(chunk)
+						f.write(chunk)
+		except:
+			partial_file_path.unlink(missing_ok=True)
+			raise
+
+		return partial_file_path, content_hash.hexdigest(), content_length
+
+	def _store_download(self, partial_file_path:pathlib.Path, content_hash:str, relative_file_path:pathlib.Path, stored_hashes:dict, scrap_reader:DbScrapReader):
+		"""
+		Keeps the downloaded file, unless the same content is stored already (by this or any previous scrap).
+
+		:return: path of the stored file relative to the scrap path (the already stored one for duplicates)
+		"""
+		stored_path = stored_hashes.get(content_hash)
+		if stored_path is None:
+			stored_path = scrap_reader.read_local_path_by_content_hash(content_hash)
+
+		if stored_path is not None and (self._settings.scrap_path / stored_path).is_file():
+			partial_file_path.unlink()
+			return pathlib.Path(stored_path)
+
+		partial_file_path.replace(self._settings.scrap_path / relative_file_path)
+		stored_hashes[content_hash] = relative_file_path
+		return relative_file_path
+
+	def _submit_thumbnail(self, relative_file_path:pathlib.Path, content_hash:str):
+		"""
+		Thumbnail is created in background, the scrap does not wait for it (missing ones are created by the gallery).
+		"""
+		if self._settings.thumbnail_path is None or not thumbnails.is_supported():
+			return
+
+		try:
+			generator = thumbnails.ThumbnailGenerator.get(self._settings.thumbnail_path)
+			generator.submit(self._settings.scrap_path / relative_file_path, content_hash)
+		except:
+			# the item is stored, the thumbnail is not essential
+			pass
+
+	def _create_result_sink(self, ts:datetime.datetime):
+		if self._settings.result_log_path is None:
+			return None
+
+		self._settings.result_log_path.mkdir(parents=True, exist_ok=True)
+		return JsonlResultSink(self._settings.result_log_path / f"{self._source.value}-{ts:%Y%m%d-%H%M%S}.jsonl")
+
 	def scrap(self):
 		ts = datetime.datetime.now()
-		result = Result(self._source, ts)
-		scrap_writer = DbScrapWriter.create(self._settings.sqlite_datafile, self._source)
+		result = Result(self._source, ts, self._create_result_sink(ts), self._settings.keep_result_items)
+		scrap_writer = DbScrapWriter.create(self._settings.sqlite_datafile, self._source, buffered=True)
+		session = self._create_session()
 
 		try:
-			for image_to_download in self._get_images_to_download():
-				# path will be like "{scrap_path}/{source}/{yyyy}/{week}/{image.jpg}"
-				relative_path = pathlib.Path(self._source.value).joinpath(f"{ts:%Y}").joinpath(f"{ts:%V}")
-				destination_path = self._settings.scrap_path / relative_path
+			# path will be like "{scrap_path}/{source}/{yyyy}/{week}/{image.jpg}"
+			relative_path = pathlib.Path(self._source.value).joinpath(f"{ts:%Y}").joinpath(f"{ts:%V}")
+			destination_path = self._settings.scrap_path / relative_path
+			source_state = DbSourceState.create(self._settings.sqlite_datafile, self._source)
+			images_to_download, page_state = self._get_images_to_download(session, source_state.read())
+
+			if len(images_to_download) > 0:
+				destination_path.mkdir(parents=True, exist_ok=True)
 
-				try:
-					destination_path.mkdir(parents=True, exist_ok=True)
-					relative_file_path = relative_path / image_to_download
+			scrap_reader = DbScrapReader.create(self._settings.sqlite_datafile, self._source)
+			# content hash -> stored local path, of the files stored by this scrap (items are not written yet)
+			stored_hashes = dict()
 
+			with concurrent.futures.ThreadPoolExecutor(max_workers=self._settings.download_workers) as executor:
+				downloads = list()
+				for image_to_download in images_to_download:
 					remote_file_url = f"{self._roumen_settings.img_base}/{image_to_download}"
-					# r = requests.get(remote_file_url, headers=Roumen.REQUEST_HEADERS)
-					urllib.request.urlretrieve(remote_file_url, filename=str(destination_path / image_to_download))
+					future = executor.submit(self._download, session, remote_file_url, destination_path / image_to_download)
+					downloads.append((image_to_download, remote_file_url, future))
 
-					result.on_item(ResultItem.createSucceeded(relative_file_path, remote_file_url))
-					scrap_writer.on_scrap_item_success(relative_file_path, image_to_download)
+				# downloads run concurrently, but their results are recorded in the order of submission
+				for image_to_download, remote_file_url, future in downloads:
+					try:
+						partial_file_path, content_hash, content_length = future.result()
+						relative_file_path = self._store_download(partial_file_path, content_hash, relative_path / image_to_download, stored_hashes, scrap_reader)
+						result.on_item(ResultItem.createSucceeded(relative_file_path, remote_file_url))
+						scrap_writer.on_scrap_item_success(relative_file_path, image_to_download, content_hash, content_length)
+						self._submit_thumbnail(relative_file_path, content_hash)
 
-				except:
-					e_info = ExceptionInfo.createFromLastException()
-					result.on_item(ResultItem.createFailed(image_to_download, e_info))
-					scrap_writer.on_scrap_item_failure(item_name=image_to_download, description="scrap failure", exception_info=e_info)
+					except:
+						e_info = ExceptionInfo.createFromLastException()
+						result.on_item(ResultItem.createFailed(image_to_download, e_info))
+						scrap_writer.on_scrap_item_failure(item_name=image_to_download, description="scrap failure", exception_info=e_info)
 
 			scrap_writer.finish()
 
+			# with failed items the same page must be parsed again, so they are retried
+			if page_state is not None and result.items_failed_count == 0:
+				source_state.write(**page_state)
+
 		except:
 			e_info = ExceptionInfo.createFromLastException()
 			result.on_scrapping_exception(e_info)
 			scrap_writer.finish_exceptionaly(e_info)
 
 		finally:
+			session.close()
 			result.on_scrapping_finished()
 
 		return result
 
-	def _get_images_to_download(self):
-		remote_image_names = self._scrap_image_names()
-		stored_image_names = DbScrapReader.create(self._settings.sqlite_datafile, self._source).read_recent_item_names()
+	def _get_images_to_download(self, session:requests.Session, page_state:dict):
+		"""
+		:return: tuple (list of image names, new page state)
+		"""
+		remote_image_names, page_state = self._scrap_image_names(session, page_state)
+		if remote_image_names is None:
+			return list(), page_state
+
+		stored_image_names = DbScrapReader.create(self._settings.sqlite_datafile, self._source).read_existing_item_names(remote_image_names)
 		images_to_download = [name for name in remote_image_names if name not in stored_image_names]
 
 		# remove possible duplicates with preserved order and then reverse, because the "top" image should be scrapped last
 		seen = set()
 		seen_add = seen.add
-		return reversed([_ for _ in images_to_download if not (_ in seen or seen_add(_))])
+		return list(reversed([_ for _ in images_to_download if not (_ in seen or seen_add(_))])), page_state
+
+	def _scrap_image_names(self, session:requests.Session, page_state:dict):
+		"""
+		Conditional request of the listing page, the page is not parsed when it is not modified (304)
+		or its body is the same as the last time.
+
+		:param page_state: state of the last scrapped page (see DbSourceState)
+		:return: tuple (list of image names or None, new page state)
+		"""
+		headers = dict()
+		if page_state.get("etag") is not None:
+			headers["If-None-Match"] = page_state["etag"]
+		if page_state.get("last_modified") is not None:
+			headers["If-Modified-Since"] = page_state["last_modified"]
+
+		r = session.get(self._roumen_settings.base_url, params=self._roumen_settings.base_url_params, headers=headers, timeout=self._settings.download_timeout)
+		if r.status_code == requests.codes.not_modified:
+			return None, page_state
+
+		r.raise_for_status()
+		new_page_state = {
+			"etag": r.headers.get("ETag"),
+			"last_modified": r.headers.get("Last-Modified"),
+			"body_hash": hashlib.sha256(r.content).hexdigest(),
+		}
+		if new_page_state["body_hash"] == page_state.get("body_hash"):
+			return None, new_page_state
 
-	def _scrap_image_names(self):
-		r = requests.get(self._roumen_settings.base_url, params=self._roumen_settings.base_url_params)
-		soup = bs4.BeautifulSoup(r.content.decode(r.apparent_encoding), features="html.parser")
+		# requests defaults to latin-1 for text without the charset, the original detection is kept for that
+		encoding = r.encoding if "charset" in r.headers.get("Content-Type", "") else r.apparent_encoding
+		page = r.content.decode(encoding or "utf-8", errors="replace")
 
 		# extract all "a" tags having "roumingShow.php" present in the "href"
-		all_urls = map(lambda a: urllib.parse.urlparse(a.get("href")), soup.find_all("a"))
+		all_urls = map(urllib.parse.urlparse, _HrefExtractor.extract(page))
 		all_show = [url for url in all_urls if isinstance(url.path,str) and self._roumen_settings.href_needle in url.path]
 
 		# extract all "file" values from the query string
 		all_qstr = [urllib.parse.parse_qs(url.query) for url in all_show]
 		all_imgs = [qs.get("file").pop() for qs in all_qstr if "file" in qs]
 
-		return all_imgs
+		return all_imgs, new_page_state
 
 
+@register(Source.ROUMEN)
 class Roumen(BaseRoumen):
 	def __init__(self, settings: Settings):
 		super().__init__(Source.ROUMEN, settings, _RoumenSettings(
@@ -100,6 +296,7 @@ class Roumen(BaseRoumen):
 			href_needle="roumingShow.php"
 		))
 
+@register(Source.ROUMEN_MASO)
 class RoumenMaso(BaseRoumen):
 	def __init__(self, settings: Settings):
 		super().__init__(Source.ROUMEN_MASO, settings, _RoumenSettings(
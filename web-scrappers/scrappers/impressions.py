@@ -0,0 +1,105 @@
+import atexit
+import threading
+from .database import DbScrapItems
+
+
+class ImpressionCounter(object):
+	"""
+	Counts the item impressions in memory and writes them behind.
+
+	Counters are sharded by the item id (every shard has its own lock), so the concurrent views do not wait for each other.
+	Aggregated increments are written in a single transaction every {flush_interval} seconds (by a background thread)
+	and on stop (at the latest at the interpreter exit), so the database writes do not grow with the views.
+	"""
+
+	SHARD_COUNT = 16
+	FLUSH_INTERVAL = 10.0
+
+	def __init__(self, scrap_items:DbScrapItems, flush_interval:float=FLUSH_INTERVAL, shard_count:int=SHARD_COUNT):
+		self._scrap_items = scrap_items
+		self._flush_interval = flush_interval
+		self._shards = [(threading.Lock(), dict()) for _ in range(shard_count)]
+		self._flush_lock = threading.Lock()
+		self._stop_event = threading.Event()
+		self._thread = None
+		self._impression_count = 0
+		self._flush_count = 0
+
+	def add(self, scrap_item_ids:list):
+		for scrap_item_id in scrap_item_ids:
+			lock, counts = self._shards[scrap_item_id % len(self._shards)]
+			with lock:
+				counts[scrap_item_id] = counts.get(scrap_item_id, 0) + 1
+
+	def _take_counts(self):
+		increments = dict()
+		for lock, counts in self._shards:
+			with lock:
+				increments.update(counts)
+				counts.clear()
+		return increments
+
+	def _return_counts(self, increments:dict):
+		# the increments are kept for the next flush, when the write fails
+		for scrap_item_id, count in increments.items():
+			lock, counts = self._shards[scrap_item_id % len(self._shards)]
+			with lock:
+				counts[scrap_item_id] = counts.get(scrap_item_id, 0) + count
+
+	def flush(self):
+		"""
+		Writes the counted impressions.
+
+		:return: number of the updated items
+		"""
+		with self._flush_lock:
+			increments = self._take_counts()
+			if len(increments) == 0:
+				return 0
+
+			try:
+				self._scrap_items.add_impressions(increments)
+			except:
+				self._return_counts(increments)
+				raise
+
+			self._impression_count += sum(increments.values())
+			self._flush_count += 1
+			return len(increments)
+
+	def _flush_loop(self):
+		while not self._stop_event.wait(self._flush_interval):
+			try:
+				self.flush()
+			except:
+				# retried by the next flush
+				pass
+
+	def start(self):
+		if self._thread is not None:
+			return
+
+		self._stop_event.clear()
+		self._thread = threading.Thread(target=self._flush_loop, name="impressions-flush", daemon=True)
+		self._thread.start()
+		atexit.register(self.stop)
+
+	def stop(self):
+		"""
+		Stops the background flushing and writes the rest of the impressions.
+		"""
+		if self._thread is not None:
+			self._stop_event.set()
+			self._thread.join()
+			self._thread = None
+			atexit.unregister(self.stop)
+
+		self.flush()
+
+	@property
+	def stats(self):
+		with self._flush_lock:
+			return {
+				"written_impressions": self._impression_count,
+				"flushes": self._flush_count,
+			}
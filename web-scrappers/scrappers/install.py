@@ -1,7 +1,39 @@
+"""
+The schema is created and upgraded by the versioned migrations.
+Version of the database is kept in the "user_version" pragma, every migration is applied once, in its own transaction.
+
+Timestamps are integer epoch milliseconds (local time, as they were stored in the text columns before).
+"""
 import sqlite3
+import datetime
+from .util import histogram
 
-def install(sql_connection: sqlite3.Connection):
-	c = sql_connection.cursor()
+
+def _add_missing_columns(c: sqlite3.Cursor, table_name: str, column_definitions: dict):
+	existing_columns = set(row[1] for row in c.execute(f"pragma table_info({table_name})"))
+	for column_name, column_type in column_definitions.items():
+		if column_name not in existing_columns:
+			c.execute(f"alter table {table_name} add column {column_name} {column_type}")
+
+
+def _text_ts_to_epoch_ms(date_string: str, time_string: str):
+	if date_string is None or time_string is None:
+		return None
+
+	for time_format in ("%H:%M.%S,%f", "%H:%M.%S"):
+		try:
+			return int(datetime.datetime.strptime(f"{date_string} {time_string}", f"%Y-%m-%d {time_format}").timestamp() * 1000)
+		except ValueError:
+			pass
+
+	return None
+
+
+def _migration_1_text_timestamps(c: sqlite3.Cursor):
+	"""
+	Original schema with text timestamps. Databases created before the versioning (some of the columns may be missing)
+	are brought to the same state.
+	"""
 	c.execute("""
 		create table if not exists scrap_stat (
 			scrap_stat_id integer primary key autoincrement,
@@ -12,7 +44,10 @@ def install(sql_connection: sqlite3.Connection):
 			ts_end_time text,
 			status text,
 			succ_count integer,
-			fail_count integer
+			fail_count integer,
+			exc_type text,
+			exc_value text,
+			exc_traceback text
 		);""")
 
 	c.execute("""
@@ -33,13 +68,214 @@ def install(sql_connection: sqlite3.Connection):
 		create table if not exists scrap_items(
 			scrap_item_id integer primary key autoincrement,
 			scrap_stat_id integer,
+			source text,
 			ts_date text,
 			ts_week text,
 			ts_time text,
 			local_path text,
 			name text,
 			impressions integer,
+			content_hash text,
 			foreign key(scrap_stat_id) references scrap_stat(scrap_stat_id)
 		);	""")
 
-	c.close()
+	c.execute("""
+		create table if not exists source_state(
+			source text primary key,
+			etag text,
+			last_modified text,
+			body_hash text,
+			ts_date text,
+			ts_time text
+		);	""")
+
+	_add_missing_columns(c, "scrap_stat", {
+		"exc_type": "text",
+		"exc_value": "text",
+		"exc_traceback": "text",
+	})
+	_add_missing_columns(c, "scrap_items", {
+		"source": "text",
+		"content_hash": "text",
+	})
+
+	# source of the items is denormalized from their scrap, so the item lookups need no join
+	c.execute("""
+		update scrap_items
+		set source=(select scrap_stat.source from scrap_stat where scrap_stat.scrap_stat_id=scrap_items.scrap_stat_id)
+		where source is null""")
+
+
+def _migration_2_epoch_timestamps(c: sqlite3.Cursor):
+	"""
+	Text date & time columns are replaced by integer epoch milliseconds (tables are rebuilt),
+	indexes cover the /view/ and the item name lookups. /stats/ reads the scrap_stat by its primary key.
+	"""
+	c.execute("""
+		create table scrap_stat_v2 (
+			scrap_stat_id integer primary key autoincrement,
+			source text,
+			ts_start integer,
+			ts_end integer,
+			status text,
+			succ_count integer,
+			fail_count integer,
+			exc_type text,
+			exc_value text,
+			exc_traceback text
+		);""")
+	c.execute("""
+		insert into scrap_stat_v2
+		select scrap_stat_id, source, epoch_ms(ts_start_date, ts_start_time), epoch_ms(ts_end_date, ts_end_time),
+			status, succ_count, fail_count, exc_type, exc_value, exc_traceback
+		from scrap_stat""")
+
+	c.execute("""
+		create table scrap_fails_v2 (
+			scrap_fail_id integer primary key autoincrement,
+			scrap_stat_id integer,
+			ts integer,
+			item_name text,
+			description text,
+			exc_type text,
+			exc_value text,
+			exc_traceback text,
+			foreign key(scrap_stat_id) references scrap_stat(scrap_stat_id)
+		);	""")
+	c.execute("""
+		insert into scrap_fails_v2
+		select scrap_fail_id, scrap_stat_id, epoch_ms(ts_date, ts_time), item_name, description, exc_type, exc_value, exc_traceback
+		from scrap_fails""")
+
+	c.execute("""
+		create table scrap_items_v2 (
+			scrap_item_id integer primary key autoincrement,
+			scrap_stat_id integer,
+			source text,
+			ts integer,
+			local_path text,
+			name text,
+			impressions integer,
+			content_hash text,
+			foreign key(scrap_stat_id) references scrap_stat(scrap_stat_id)
+		);	""")
+	c.execute("""
+		insert into scrap_items_v2
+		select scrap_item_id, scrap_stat_id, source, epoch_ms(ts_date, ts_time), local_path, name, impressions, content_hash
+		from scrap_items""")
+
+	c.execute("""
+		create table source_state_v2 (
+			source text primary key,
+			etag text,
+			last_modified text,
+			body_hash text,
+			ts integer
+		);	""")
+	c.execute("""
+		insert into source_state_v2
+		select source, etag, last_modified, body_hash, epoch_ms(ts_date, ts_time)
+		from source_state""")
+
+	for table_name in ("scrap_items", "scrap_fails", "source_state", "scrap_stat"):
+		c.execute(f"drop table {table_name}")
+		c.execute(f"alter table {table_name}_v2 rename to {table_name}")
+
+	c.execute("create index ix_scrap_items_source_ts on scrap_items(source, ts, name, local_path, impressions)")
+	c.execute("create index ix_scrap_items_source_name on scrap_items(source, name, ts)")
+	c.execute("create index ix_scrap_items_content_hash on scrap_items(content_hash)")
+	c.execute("create index ix_scrap_fails_scrap_stat_id on scrap_fails(scrap_stat_id)")
+
+
+def _migration_3_items_keyset_index(c: sqlite3.Cursor):
+	"""
+	Item pages are seeked by (ts, scrap_item_id), the item id follows the ts in the covering index,
+	so the order by the both columns needs no sorting.
+	"""
+	c.execute("drop index ix_scrap_items_source_ts")
+	c.execute("create index ix_scrap_items_source_ts_id on scrap_items(source, ts, scrap_item_id, name, local_path, impressions)")
+
+
+def _migration_4_daily_stats(c: sqlite3.Cursor):
+	"""
+	Daily rollups of the scraps per source, they are updated by every finished scrap (see DbDailyStats),
+	so the trends are read without scanning the scrap history. Existing scraps are rolled up here.
+	Bytes downloaded are known only for the scraps from now on.
+	"""
+	_add_missing_columns(c, "scrap_stat", {
+		"bytes_downloaded": "integer",
+	})
+
+	c.execute("""
+		create table scrap_daily_stats (
+			day text,
+			source text,
+			scrap_count integer,
+			failed_scrap_count integer,
+			succ_count integer,
+			fail_count integer,
+			bytes_downloaded integer,
+			duration_histogram text,
+			duration_p50_ms integer,
+			duration_p95_ms integer,
+			primary key(day, source)
+		) without rowid;	""")
+
+	c.execute("""
+		insert into scrap_daily_stats
+		select
+			date(ts_start / 1000, 'unixepoch', 'localtime'),
+			source,
+			count(*),
+			sum(status='failed'),
+			sum(coalesce(succ_count, 0)),
+			sum(coalesce(fail_count, 0)),
+			sum(coalesce(bytes_downloaded, 0)),
+			duration_histogram(ts_end - ts_start),
+			null,
+			null
+		from scrap_stat
+		where ts_start is not null and ts_end is not null
+		group by 1, 2""")
+
+	c.execute("""
+		update scrap_daily_stats
+		set duration_p50_ms=histogram_percentile(duration_histogram, 0.5), duration_p95_ms=histogram_percentile(duration_histogram, 0.95)""")
+
+
+MIGRATIONS = [
+	_migration_1_text_timestamps,
+	_migration_2_epoch_timestamps,
+	_migration_3_items_keyset_index,
+	_migration_4_daily_stats,
+]
+
+
+def schema_version(sql_connection: sqlite3.Connection):
+	return sql_connection.execute("pragma user_version").fetchone()[0]
+
+
+def install(sql_connection: sqlite3.Connection):
+	"""
+	Applies the migrations the database is missing.
+	"""
+	sql_connection.create_function("epoch_ms", 2, _text_ts_to_epoch_ms, deterministic=True)
+	histogram.register_sql_functions(sql_connection)
+
+	for version, migration in enumerate(MIGRATIONS, start=1):
+		if schema_version(sql_connection) >= version:
+			continue
+
+		c = sql_connection.cursor()
+		try:
+			# immediate transaction, so concurrent installs are serialized (version is checked again in the transaction)
+			c.execute("begin immediate")
+			if schema_version(sql_connection) < version:
+				migration(c)
+				c.execute(f"pragma user_version={version}")
+			sql_connection.commit()
+		except:
+			sql_connection.rollback()
+			raise
+		finally:
+			c.close()
@@ -0,0 +1,90 @@
+import time
+import hashlib
+import threading
+import collections
+
+
+class PageCache(object):
+	"""
+	In-process cache of the rendered pages with TTL and LRU eviction.
+	Every entry carries an ETag (hash of the content), so the unchanged pages can be answered by 304.
+	"""
+
+	MAX_ENTRIES = 64
+	TTL_SECONDS = 300.0
+
+	def __init__(self, max_entries:int=MAX_ENTRIES, ttl_seconds:float=TTL_SECONDS):
+		self._max_entries = max_entries
+		self._ttl_seconds = ttl_seconds
+		self._entries = collections.OrderedDict()
+		self._lock = threading.Lock()
+		# incremented by every invalidation, pages rendered before are not stored
+		self._generation = 0
+		self._hit_count = 0
+		self._miss_count = 0
+
+	def get(self, key:tuple):
+		"""
+		:return: tuple (content, etag) or None, when the key is not cached or it has expired
+		"""
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is None or entry[0] < time.monotonic():
+				if entry is not None:
+					del self._entries[key]
+				self._miss_count += 1
+				return None
+
+			self._entries.move_to_end(key)
+			self._hit_count += 1
+			return entry[1], entry[2]
+
+	def put(self, key:tuple, content:str, generation:int=None):
+		"""
+		:param generation: generation the content was rendered in, the content is not stored when invalidated since
+		:return: etag of the content
+		"""
+		etag = hashlib.sha1(content.encode("utf-8")).hexdigest()
+		with self._lock:
+			if generation is None or generation == self._generation:
+				self._entries[key] = (time.monotonic() + self._ttl_seconds, content, etag)
+				self._entries.move_to_end(key)
+				while len(self._entries) > self._max_entries:
+					self._entries.popitem(last=False)
+		return etag
+
+	def get_or_render(self, key:tuple, render_cb:callable):
+		"""
+		:return: tuple (content, etag), the content is rendered by {render_cb}() when not cached
+		"""
+		cached = self.get(key)
+		if cached is not None:
+			return cached
+
+		with self._lock:
+			generation = self._generation
+
+		content = render_cb()
+		return content, self.put(key, content, generation)
+
+	def invalidate(self, key_predicate:callable=None):
+		"""
+		Removes the entries matching the predicate (all entries without the predicate).
+		"""
+		with self._lock:
+			self._generation += 1
+			if key_predicate is None:
+				self._entries.clear()
+				return
+
+			for key in [k for k in self._entries.keys() if key_predicate(k)]:
+				del self._entries[key]
+
+	@property
+	def stats(self):
+		with self._lock:
+			return {
+				"entries": len(self._entries),
+				"hits": self._hit_count,
+				"misses": self._miss_count,
+			}
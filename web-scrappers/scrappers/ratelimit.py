@@ -0,0 +1,75 @@
+import time
+import threading
+import urllib.parse
+
+
+class TokenBucket(object):
+	"""
+	{rate} tokens per second, up to {capacity} tokens are saved for a burst.
+	"""
+
+	def __init__(self, rate:float, capacity:float):
+		self._rate = rate
+		self._capacity = capacity
+		self._tokens = capacity
+		self._ts_refill = time.monotonic()
+		self._lock = threading.Lock()
+
+	def try_acquire(self):
+		"""
+		:return: 0 when the token was taken, otherwise seconds to wait for the next one
+		"""
+		with self._lock:
+			ts_now = time.monotonic()
+			self._tokens = min(self._capacity, self._tokens + (ts_now - self._ts_refill) * self._rate)
+			self._ts_refill = ts_now
+			if self._tokens >= 1:
+				self._tokens -= 1
+				return 0
+			return (1 - self._tokens) / self._rate
+
+	def acquire(self):
+		"""
+		Waits for a token.
+		"""
+		while True:
+			wait_seconds = self.try_acquire()
+			if wait_seconds == 0:
+				return
+			time.sleep(wait_seconds)
+
+
+class HostRateLimiter(object):
+	"""
+	Token bucket per host. Limiters are shared per rate and burst (see get()),
+	so all the scraps of the process count the requests of a host together.
+	"""
+
+	_instances = dict()
+	_instances_lock = threading.Lock()
+
+	@classmethod
+	def get(cls, requests_per_second:float, burst:int):
+		key = (requests_per_second, burst)
+		with cls._instances_lock:
+			instance = cls._instances.get(key)
+			if instance is None:
+				instance = cls._instances[key] = cls(requests_per_second, burst)
+			return instance
+
+	def __init__(self, requests_per_second:float, burst:int):
+		self._requests_per_second = requests_per_second
+		self._burst = burst
+		self._buckets = dict()
+		self._lock = threading.Lock()
+
+	def acquire(self, url:str):
+		"""
+		Waits until the host of the url can be requested.
+		"""
+		host = urllib.parse.urlsplit(url).netloc.lower()
+		with self._lock:
+			bucket = self._buckets.get(host)
+			if bucket is None:
+				bucket = self._buckets[host] = TokenBucket(self._requests_per_second, self._burst)
+		bucket.acquire()
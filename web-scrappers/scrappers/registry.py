@@ -0,0 +1,64 @@
+"""
+Scrapper implementations register themselves by the @register(source) decorator.
+They are discovered by importing all the modules of the scrappers.impl package and the modules
+of the "scrappers.impl" entry points (entry point name is the source value, it may refer to the class itself).
+"""
+import threading
+import pkgutil
+import importlib
+import importlib.metadata
+from .sources import Source
+
+
+ENTRY_POINT_GROUP = "scrappers.impl"
+
+_scrapper_classes = dict()
+_discovery_lock = threading.Lock()
+_discovered = False
+
+
+def register(source:Source):
+	def _register(scrapper_class):
+		_scrapper_classes[source] = scrapper_class
+		return scrapper_class
+
+	return _register
+
+
+def _discover_modules():
+	from . import impl
+	for module_info in pkgutil.iter_modules(impl.__path__):
+		importlib.import_module(f"{impl.__name__}.{module_info.name}")
+
+
+def _discover_entry_points():
+	for entry_point in importlib.metadata.entry_points(group=ENTRY_POINT_GROUP):
+		scrapper_class = entry_point.load()
+		source = Source.of(entry_point.name)
+		if isinstance(scrapper_class, type) and source is not Source.NOOP and source not in _scrapper_classes:
+			_scrapper_classes[source] = scrapper_class
+
+
+def discover():
+	"""
+	Imports the implementations (once), so they are registered.
+	"""
+	global _discovered
+	with _discovery_lock:
+		if not _discovered:
+			_discover_modules()
+			_discover_entry_points()
+			_discovered = True
+
+
+def get_class(source:Source):
+	"""
+	:return: scrapper class of the source or None
+	"""
+	discover()
+	return _scrapper_classes.get(source)
+
+
+def registered_sources():
+	discover()
+	return [s for s in Source if s in _scrapper_classes]
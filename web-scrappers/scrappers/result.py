@@ -3,6 +3,7 @@ from enum import Enum, auto
 import typing
 import pathlib
 import datetime
+import json
 from .sources import Source
 from .util.exception_info import ExceptionInfo
 from .util.formatters import percentage_str
@@ -14,6 +15,8 @@ class ResultItemStatus(Enum):
 
 
 class ResultItemSuccessInfo(object):
+	__slots__ = ("_relative_file_path", "_remote_file_url")
+
 	def __init__(self, relative_file_path: str, remote_file_url: str):
 		self._relative_file_path = relative_file_path
 		self._remote_file_url = remote_file_url
@@ -31,6 +34,8 @@ class ResultItemSuccessInfo(object):
 
 
 class ResultItemFailedInfo(object):
+	__slots__ = ("_item_to_download", "_exception_info")
+
 	def __init__(self, item_to_download: str, exception_info: ExceptionInfo):
 		self._item_to_download = item_to_download
 		self._exception_info = exception_info
@@ -48,6 +53,8 @@ class ResultItemFailedInfo(object):
 
 
 class ResultItem(object):
+	__slots__ = ("_status", "_s_info", "_e_info")
+
 	@classmethod
 	def createSucceeded(cls, relative_file_path: str, remote_file_url: str):
 		item_info = ResultItemSuccessInfo(relative_file_path, remote_file_url)
@@ -80,22 +87,79 @@ class ResultItem(object):
 		return self._s_info
 
 
+class JsonlResultSink(object):
+	"""
+	Writes the result items to a jsonl file as they come, one json object per line.
+	"""
+
+	def __init__(self, file_path:pathlib.Path):
+		self._file = open(file_path, "a", encoding="utf-8")
+
+	def on_item(self, result_item:ResultItem):
+		if result_item.status == ResultItemStatus.SUCCEEDED:
+			record = {
+				"status": result_item.status.name,
+				"relative_file_path": str(result_item.success_info.relative_file_path),
+				"remote_file_url": result_item.success_info.remote_file_url,
+			}
+		else:
+			e_info = result_item.error_info.e_info
+			record = {
+				"status": result_item.status.name,
+				"item_to_download": result_item.error_info.item_to_download,
+				"exc_type": str(e_info.exception_type),
+				"exc_value": str(e_info.value),
+				"exc_traceback": "".join(e_info.formatted_exception),
+			}
+		self._file.write(json.dumps(record) + "\n")
+
+	def close(self):
+		self._file.close()
+
+
 class Result(object):
-	def __init__(self, source: Source, ts_start: datetime.datetime=None):
+	"""
+	Result of a scrap. Item counts are kept as the items come, so the aggregates do not go through the items.
+
+	Items are passed to the sink (an object with on_item(item) and close(), closed when the scrapping is finished),
+	with keep_items=False they are not kept in the memory (only counted), which is meant for the big scraps with a sink.
+	"""
+
+	def __init__(self, source: Source, ts_start: datetime.datetime=None, sink=None, keep_items: bool=True):
 		self._source = source
 		self._ts_start = ts_start if ts_start is not None else datetime.datetime.now()
 		self._time_taken = "unknown"
+		self._sink = sink
+		self._keep_items = keep_items
 		self._items = list()
+		self._items_succeeded = list()
+		self._items_failed = list()
+		self._items_succeeded_count = 0
+		self._items_failed_count = 0
 		self._general_error = list()
 
 	def __str__(self):
 		return f"Result of [{self._source.value}] scrapper: {self.items_succeeded_count} of {self.items_count} ({self.success_percentage_str}) scrapped in {self.time_taken}"
 
 	def on_item(self, result_item: ResultItem):
-		self._items.append(result_item)
+		succeeded = result_item.status == ResultItemStatus.SUCCEEDED
+		if succeeded:
+			self._items_succeeded_count += 1
+		else:
+			self._items_failed_count += 1
+
+		if self._sink is not None:
+			self._sink.on_item(result_item)
+
+		if self._keep_items:
+			self._items.append(result_item)
+			(self._items_succeeded if succeeded else self._items_failed).append(result_item)
 
 	def on_scrapping_finished(self):
 		self._time_taken = str(datetime.datetime.now() - self._ts_start)
+		if self._sink is not None:
+			self._sink.close()
+			self._sink = None
 
 	def on_scrapping_exception(self, error: ExceptionInfo):
 		self._general_error.append(error)
@@ -109,27 +173,30 @@ class Result(object):
 
 	@property
 	def items(self):
-		return self.get_items()
+		"""
+		all the items in their order (empty when the items are not kept)
+		"""
+		return self._items
 
 	@property
 	def items_count(self):
-		return len(self.items)
+		return self._items_succeeded_count + self._items_failed_count
 
 	@property
 	def items_succeeded(self):
-		return self.get_items(lambda item: item.status == ResultItemStatus.SUCCEEDED)
+		return self._items_succeeded
 
 	@property
 	def items_succeeded_count(self):
-		return len(self.items_succeeded)
+		return self._items_succeeded_count
 
 	@property
 	def items_failed(self):
-		return self.get_items(lambda item: item.status == ResultItemStatus.FAILED)
+		return self._items_failed
 
 	@property
 	def items_failed_count(self):
-		return len(self.items_failed)
+		return self._items_failed_count
 
 	@property
 	def success_percentage_str(self):
@@ -0,0 +1,273 @@
+import enum
+import datetime
+import threading
+import uuid
+import random
+import time
+import pathlib
+import collections
+import concurrent.futures
+from .sources import Source
+from .settings import Settings
+from .result import Result
+from .util.exception_info import ExceptionInfo
+from .factory import create
+from .database import DbStatReader
+
+
+class ScrapJobState(enum.Enum):
+	PENDING = "pending"
+	RUNNING = "running"
+	FINISHED = "finished"
+
+
+class ScrapJob(object):
+	"""
+	Scrap of several sources running in parallel, results are collected per source as the scrappers finish.
+	"""
+
+	def __init__(self, sources:list):
+		self._job_id = uuid.uuid4().hex
+		self._sources = list(sources)
+		self._started = set()
+		self._results = dict()
+		self._lock = threading.Lock()
+		self._finished_event = threading.Event()
+		self._ts_start = datetime.datetime.now()
+		self._ts_end = None
+		if len(self._sources) == 0:
+			self._ts_end = self._ts_start
+			self._finished_event.set()
+
+	def __str__(self):
+		return f"Scrap job [{self._job_id}]: {self.state.value}, {self.finished_count} of {len(self._sources)} sources finished"
+
+	def _on_started(self, source:Source):
+		with self._lock:
+			self._started.add(source)
+
+	def _on_result(self, source:Source, result:Result):
+		with self._lock:
+			self._results[source] = result
+			if len(self._results) == len(self._sources):
+				self._ts_end = datetime.datetime.now()
+				self._finished_event.set()
+
+	def wait(self, timeout:float=None):
+		return self._finished_event.wait(timeout)
+
+	@property
+	def job_id(self):
+		return self._job_id
+
+	@property
+	def sources(self):
+		return self._sources
+
+	@property
+	def state(self):
+		with self._lock:
+			if len(self._results) == len(self._sources):
+				return ScrapJobState.FINISHED
+			return ScrapJobState.RUNNING if len(self._started) > 0 else ScrapJobState.PENDING
+
+	def source_state(self, source:Source):
+		with self._lock:
+			if source in self._results:
+				return ScrapJobState.FINISHED
+			return ScrapJobState.RUNNING if source in self._started else ScrapJobState.PENDING
+
+	@property
+	def is_finished(self):
+		return self._finished_event.is_set()
+
+	@property
+	def finished_count(self):
+		with self._lock:
+			return len(self._results)
+
+	@property
+	def results(self):
+		"""
+		results of the finished sources (in the order of sources)
+		"""
+		with self._lock:
+			return {s: self._results[s] for s in self._sources if s in self._results}
+
+	@property
+	def ts_start(self):
+		return self._ts_start
+
+	@property
+	def ts_end(self):
+		return self._ts_end
+
+
+class ScrapScheduler(object):
+	"""
+	Runs the scrappers of all the sources at the same time.
+
+	scrap_all() waits for all the results, submit() returns the job right away (its progress is polled by get_job()).
+	There is only one job running at a time, submit() returns the running job instead of starting another one.
+	submit_source() starts a job of a single source (used by the PeriodicScrapScheduler).
+	Every source is owned by one job at a time, so it is never scrapped twice in parallel: submit() skips the sources
+	being scrapped by another job, submit_source() does not start the job at all.
+	All the scraps share the executor, so {max_workers} is the cap of the concurrent scraps.
+	"""
+
+	MAX_WORKERS = 4
+	MAX_JOBS_KEPT = 20
+
+	def __init__(self, settings:Settings, max_workers:int=MAX_WORKERS, max_jobs_kept:int=MAX_JOBS_KEPT):
+		self._settings = settings
+		self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scrap")
+		self._jobs = collections.OrderedDict()
+		self._max_jobs_kept = max_jobs_kept
+		self._lock = threading.Lock()
+		self._running_job = None
+		# job scrapping the source (from its submit to its result), the source is released only by its own job
+		self._source_owners = dict()
+
+	def _scrap(self, job:ScrapJob, source:Source):
+		job._on_started(source)
+		try:
+			result = create(source=source, settings=self._settings).scrap()
+		except:
+			# scrappers report their own failures in the result, this is the last resort
+			result = Result(source)
+			result.on_scrapping_exception(ExceptionInfo.createFromLastException())
+			result.on_scrapping_finished()
+
+		with self._lock:
+			if self._source_owners.get(source) is job:
+				del self._source_owners[source]
+		job._on_result(source, result)
+
+	def _add_job(self, job:ScrapJob):
+		self._jobs[job.job_id] = job
+		for source in job.sources:
+			self._source_owners[source] = job
+		while len(self._jobs) > self._max_jobs_kept:
+			self._jobs.popitem(last=False)
+
+	def submit(self, sources:list):
+		"""
+		:param sources: list of Source to scrap (the ones being scrapped by another job are skipped)
+		:return: ScrapJob
+		"""
+		with self._lock:
+			if self._running_job is not None and not self._running_job.is_finished:
+				return self._running_job
+
+			job = ScrapJob([source for source in sources if source not in self._source_owners])
+			self._running_job = job
+			self._add_job(job)
+
+		for source in job.sources:
+			self._executor.submit(self._scrap, job, source)
+
+		return job
+
+	def submit_source(self, source:Source):
+		"""
+		:return: ScrapJob or None, when the source is being scrapped already
+		"""
+		with self._lock:
+			if source in self._source_owners:
+				return None
+
+			job = ScrapJob([source])
+			self._add_job(job)
+
+		self._executor.submit(self._scrap, job, source)
+		return job
+
+	def scrap_all(self, sources:list):
+		"""
+		:param sources: list of Source to scrap
+		:return: dict of Result by Source
+		"""
+		job = self.submit(sources)
+		job.wait()
+		return job.results
+
+	def get_job(self, job_id:str):
+		"""
+		:return: ScrapJob or None for unknown (or already forgotten) job
+		"""
+		with self._lock:
+			return self._jobs.get(job_id)
+
+	def shutdown(self, wait:bool=True):
+		self._executor.shutdown(wait=wait)
+
+
+class PeriodicScrapScheduler(object):
+	"""
+	Scraps every source on its own interval (by the ScrapScheduler), every run is delayed by a random jitter
+	of up to {jitter} * interval, so the sources drift apart.
+
+	Last runs are the scrap starts stored in the database. After a restart, the sources are scrapped when their interval
+	since the last run is over, the overdue ones are spread by the jitter, so the sites are not hit all at once.
+	"""
+
+	JITTER = 0.1
+
+	def __init__(self, scheduler:ScrapScheduler, sqlite_datafile:pathlib.Path, intervals:dict, jitter:float=JITTER):
+		"""
+		:param intervals: interval in seconds by Source
+		"""
+		self._scheduler = scheduler
+		self._sqlite_datafile = sqlite_datafile
+		self._intervals = dict(intervals)
+		self._jitter = jitter
+		self._next_runs = dict()
+		self._stop_event = threading.Event()
+		self._thread = None
+
+	def _jitter_seconds(self, source:Source):
+		return random.uniform(0, self._jitter * self._intervals[source])
+
+	def _plan_first_runs(self):
+		# wall clock of the last runs is converted to the monotonic clock of the planning
+		ts_now = time.time()
+		monotonic_now = time.monotonic()
+		last_starts = DbStatReader.create(self._sqlite_datafile).read_last_scrap_starts()
+		for source, interval in self._intervals.items():
+			last_start = last_starts.get(source.value)
+			due_in = 0 if last_start is None else last_start / 1000 + interval - ts_now
+			self._next_runs[source] = monotonic_now + max(due_in, 0) + self._jitter_seconds(source)
+
+	def _run(self):
+		self._plan_first_runs()
+		while not self._stop_event.is_set():
+			monotonic_now = time.monotonic()
+			for source, next_run in self._next_runs.items():
+				if next_run <= monotonic_now:
+					# running source (e.g. scrapped by hand) is skipped, its interval starts again
+					self._scheduler.submit_source(source)
+					self._next_runs[source] = monotonic_now + self._intervals[source] + self._jitter_seconds(source)
+
+			self._stop_event.wait(max(min(self._next_runs.values()) - time.monotonic(), 0))
+
+	@property
+	def next_runs(self):
+		"""
+		seconds to the next run by Source
+		"""
+		monotonic_now = time.monotonic()
+		return {source: max(next_run - monotonic_now, 0) for (source, next_run) in dict(self._next_runs).items()}
+
+	def start(self):
+		if self._thread is not None or len(self._intervals) == 0:
+			return
+
+		self._stop_event.clear()
+		self._thread = threading.Thread(target=self._run, name="scrap-periodic", daemon=True)
+		self._thread.start()
+
+	def stop(self):
+		if self._thread is not None:
+			self._stop_event.set()
+			self._thread.join()
+			self._thread = None
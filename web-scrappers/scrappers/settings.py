@@ -3,10 +3,22 @@ import pathlib
 
 
 class Settings(object):
-	def __init__(self, local_base_path: pathlib.Path, local_relative_path: pathlib.Path, sqlite_datafile: pathlib.Path):
+	def __init__(self, local_base_path: pathlib.Path, local_relative_path: pathlib.Path, sqlite_datafile: pathlib.Path,
+				 download_workers: int=4, download_retries: int=3, download_backoff: float=0.5, download_timeout: float=30.0,
+				 requests_per_second: float=None, requests_burst: int=4,
+				 thumbnail_relative_path: pathlib.Path=None, keep_result_items: bool=True, result_log_path: pathlib.Path=None):
 		self._base_path = local_base_path
 		self._relative_path = local_relative_path
 		self._sqlite_datafile = sqlite_datafile
+		self._download_workers = download_workers
+		self._download_retries = download_retries
+		self._download_backoff = download_backoff
+		self._download_timeout = download_timeout
+		self._requests_per_second = requests_per_second
+		self._requests_burst = requests_burst
+		self._thumbnail_relative_path = thumbnail_relative_path
+		self._keep_result_items = keep_result_items
+		self._result_log_path = result_log_path
 
 	@property
 	def base_path(self):
@@ -23,3 +35,57 @@ class Settings(object):
 	@property
 	def sqlite_datafile(self):
 		return self._sqlite_datafile
+
+	@property
+	def download_workers(self):
+		"""
+		number of concurrent downloads (and connections per host)
+		"""
+		return self._download_workers
+
+	@property
+	def download_retries(self):
+		return self._download_retries
+
+	@property
+	def download_backoff(self):
+		"""
+		backoff factor (in seconds) of the retries, delays are {backoff} * 2 ** (retry - 1)
+		"""
+		return self._download_backoff
+
+	@property
+	def download_timeout(self):
+		return self._download_timeout
+
+	@property
+	def requests_per_second(self):
+		"""
+		rate limit of the requests per host or None for no limit
+		"""
+		return self._requests_per_second
+
+	@property
+	def requests_burst(self):
+		return self._requests_burst
+
+	@property
+	def thumbnail_path(self):
+		"""
+		cache directory of the thumbnails or None, when the thumbnails are not created
+		"""
+		return None if self._thumbnail_relative_path is None else self._base_path / self._thumbnail_relative_path
+
+	@property
+	def keep_result_items(self):
+		"""
+		items of the scrap results are kept in the memory (otherwise they are only counted)
+		"""
+		return self._keep_result_items
+
+	@property
+	def result_log_path(self):
+		"""
+		directory of the jsonl logs of the result items or None
+		"""
+		return self._result_log_path
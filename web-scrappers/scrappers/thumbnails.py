@@ -0,0 +1,147 @@
+import os
+import pathlib
+import hashlib
+import threading
+import multiprocessing
+import concurrent.futures
+
+try:
+	import PIL.Image
+	import PIL.ImageOps
+	import PIL.features
+except ImportError:
+	PIL = None
+
+
+def is_supported():
+	"""
+	Thumbnails need the Pillow package, without it the originals are served.
+	"""
+	return PIL is not None
+
+
+def file_content_hash(file_path:pathlib.Path):
+	"""
+	Content hash of a stored file (the same as the scrappers store with the items).
+	"""
+	content_hash = hashlib.sha256()
+	with open(file_path, "rb") as f:
+		for chunk in iter(lambda: f.read(64 * 1024), b""):
+			content_hash.update(chunk)
+	return content_hash.hexdigest()
+
+
+def _make_thumbnail(source_file:str, target_file:str, size:int, image_format:str):
+	"""
+	Executed in the process pool, so it is a module level function with plain arguments.
+	"""
+	if os.path.isfile(target_file):
+		return target_file
+
+	with PIL.Image.open(source_file) as image:
+		# first frame of the animations, orientation by the exif
+		image.seek(0)
+		image = PIL.ImageOps.exif_transpose(image)
+		image.thumbnail((size, size))
+		if image.mode not in ("RGB", "RGBA") or (image_format == "JPEG" and image.mode == "RGBA"):
+			image = image.convert("RGB")
+
+		# written to a temporary file first, so the readers never see a partial thumbnail
+		partial_file = f"{target_file}.{os.getpid()}.part"
+		os.makedirs(os.path.dirname(target_file), exist_ok=True)
+		image.save(partial_file, format=image_format, quality=80)
+		os.replace(partial_file, target_file)
+
+	return target_file
+
+
+class ThumbnailGenerator(object):
+	"""
+	Resized variants of the images in a content addressed cache directory:
+	"{cache_dir}/{hash[:2]}/{hash}_{size}.{webp|jpg}", so the same content is resized once, whatever its name is.
+	Images are resized in a process pool (created with the first thumbnail). Instances are shared per cache directory.
+	"""
+
+	SIZE = 480
+	MAX_WORKERS = 2
+
+	_instances = dict()
+	_instances_lock = threading.Lock()
+
+	@classmethod
+	def get(cls, cache_dir:pathlib.Path):
+		key = str(pathlib.Path(cache_dir).resolve())
+		with cls._instances_lock:
+			instance = cls._instances.get(key)
+			if instance is None:
+				instance = cls._instances[key] = cls(cache_dir)
+			return instance
+
+	def __init__(self, cache_dir:pathlib.Path, size:int=SIZE, max_workers:int=MAX_WORKERS):
+		self._cache_dir = pathlib.Path(cache_dir)
+		self._size = size
+		self._max_workers = max_workers
+		self._executor = None
+		self._executor_lock = threading.Lock()
+		self._pending = dict()
+		webp = is_supported() and PIL.features.check("webp")
+		self._image_format, self._extension = ("WEBP", "webp") if webp else ("JPEG", "jpg")
+
+	def _get_executor(self):
+		with self._executor_lock:
+			if self._executor is None:
+				# spawned workers, the web server and the scrappers fork from many threads
+				self._executor = concurrent.futures.ProcessPoolExecutor(
+					max_workers=self._max_workers,
+					mp_context=multiprocessing.get_context("spawn"))
+			return self._executor
+
+	@property
+	def mimetype(self):
+		return f"image/{'webp' if self._extension == 'webp' else 'jpeg'}"
+
+	def thumbnail_path(self, content_hash:str):
+		return self._cache_dir / content_hash[:2] / f"{content_hash}_{self._size}.{self._extension}"
+
+	def submit(self, source_file:pathlib.Path, content_hash:str):
+		"""
+		Creates the thumbnail in background (nothing is done, when it exists or is being created).
+
+		:return: future of the thumbnail path (str)
+		"""
+		target_file = self.thumbnail_path(content_hash)
+		with self._executor_lock:
+			future = self._pending.get(content_hash)
+			if future is not None:
+				return future
+
+		if target_file.is_file():
+			future = concurrent.futures.Future()
+			future.set_result(str(target_file))
+			return future
+
+		future = self._get_executor().submit(_make_thumbnail, str(source_file), str(target_file), self._size, self._image_format)
+		with self._executor_lock:
+			self._pending[content_hash] = future
+		future.add_done_callback(lambda f: self._on_done(content_hash))
+		return future
+
+	def _on_done(self, content_hash:str):
+		with self._executor_lock:
+			self._pending.pop(content_hash, None)
+
+	def get_or_create(self, source_file:pathlib.Path, content_hash:str, timeout:float=None):
+		"""
+		:return: path of the thumbnail, created when it does not exist yet
+		"""
+		target_file = self.thumbnail_path(content_hash)
+		if target_file.is_file():
+			return target_file
+
+		return pathlib.Path(self.submit(source_file, content_hash).result(timeout))
+
+	def shutdown(self, wait:bool=True):
+		with self._executor_lock:
+			executor, self._executor = self._executor, None
+		if executor is not None:
+			executor.shutdown(wait=wait)
@@ -1,5 +1,5 @@
 __version__ = "v0.1"
-__all__ = [ "exception_info", "formatters" ]
+__all__ = [ "exception_info", "formatters", "histogram" ]
 
 from .exception_info import ExceptionInfo
 from .formatters import *
@@ -19,6 +19,13 @@ def ts_to_str(format:TIMESTAMP_FORMAT, ts:datetime.datetime.timestamp=None):
 def str_to_ts(format:TIMESTAMP_FORMAT, ts_string:str):
 	return datetime.datetime.strptime(ts_string, format.value)
 
+def ts_to_epoch_ms(ts:datetime.datetime=None):
+	_ts = ts if ts is not None else datetime.datetime.now()
+	return int(_ts.timestamp() * 1000)
+
+def epoch_ms_to_ts(epoch_ms:int):
+	return datetime.datetime.fromtimestamp(epoch_ms / 1000)
+
 def ts_diff_to_str(ts_start:datetime.datetime, ts_end:datetime.datetime, include_ms):
 	return td_format((ts_start - ts_end) if ts_start > ts_end else (ts_end - ts_start), include_ms)
 
@@ -35,6 +42,15 @@ def td_format(td:datetime.timedelta, include_ms):
 def percentage_str(count:int, total:int):
 	return NOT_AVAILABLE_STR if total == 0 else f"{(100.0 * count) / total:3.2f}%"
 
+def size_to_str(size_bytes:int):
+	if size_bytes is None:
+		return NOT_AVAILABLE_STR
+	size = float(size_bytes)
+	for unit in ("B", "KiB", "MiB", "GiB"):
+		if size < 1024 or unit == "GiB":
+			return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+		size /= 1024
+
 
 if __name__ == "__main__":
 	ts = datetime.datetime.now()
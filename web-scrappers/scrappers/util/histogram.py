@@ -0,0 +1,86 @@
+import json
+import bisect
+import sqlite3
+
+
+class DurationHistogram(object):
+	"""
+	Histogram of durations (in milliseconds) with logarithmic buckets, every bucket is ~9% wider than the previous one.
+	Percentiles are estimated by the upper bound of their bucket, so the histogram of any number of durations
+	takes a constant space. Histograms are stored as json (only the non-empty buckets).
+	"""
+
+	# 100 ms .. ~27 hours, longer durations fall into the last bucket
+	BUCKET_BOUNDS_MS = [100 * 2 ** (i / 8) for i in range(160)]
+
+	def __init__(self, counts:dict=None, max_ms:int=None):
+		self._counts = dict() if counts is None else counts
+		self._max_ms = max_ms
+
+	@classmethod
+	def from_json(cls, histogram_json:str):
+		if histogram_json is None:
+			return cls()
+		data = json.loads(histogram_json)
+		return cls({int(k): v for (k, v) in data["counts"].items()}, data["max"])
+
+	def to_json(self):
+		return json.dumps({"counts": self._counts, "max": self._max_ms}, separators=(",", ":"))
+
+	@property
+	def count(self):
+		return sum(self._counts.values())
+
+	def add(self, duration_ms:int):
+		if duration_ms is None:
+			return
+		bucket = min(bisect.bisect_left(DurationHistogram.BUCKET_BOUNDS_MS, duration_ms), len(DurationHistogram.BUCKET_BOUNDS_MS) - 1)
+		self._counts[bucket] = self._counts.get(bucket, 0) + 1
+		self._max_ms = duration_ms if self._max_ms is None else max(self._max_ms, duration_ms)
+
+	def percentile(self, q:float):
+		"""
+		:return: estimated q-th (0..1) percentile or None for empty histogram
+		"""
+		total = self.count
+		if total == 0:
+			return None
+
+		cumulative = 0
+		for bucket in sorted(self._counts.keys()):
+			cumulative += self._counts[bucket]
+			if cumulative >= q * total:
+				return int(min(DurationHistogram.BUCKET_BOUNDS_MS[bucket], self._max_ms))
+
+		return self._max_ms
+
+
+def _histogram_add(histogram_json:str, duration_ms:int):
+	histogram = DurationHistogram.from_json(histogram_json)
+	histogram.add(duration_ms)
+	return histogram.to_json()
+
+
+def _histogram_percentile(histogram_json:str, q:float):
+	return DurationHistogram.from_json(histogram_json).percentile(q)
+
+
+class _HistogramAggregate(object):
+	def __init__(self):
+		self._histogram = DurationHistogram()
+
+	def step(self, duration_ms):
+		self._histogram.add(duration_ms)
+
+	def finalize(self):
+		return self._histogram.to_json()
+
+
+def register_sql_functions(sql_connection:sqlite3.Connection):
+	"""
+	histogram_add(histogram, duration), histogram_percentile(histogram, q) and the duration_histogram(duration) aggregate,
+	so the histograms are kept up to date in the sql statements.
+	"""
+	sql_connection.create_function("histogram_add", 2, _histogram_add, deterministic=True)
+	sql_connection.create_function("histogram_percentile", 2, _histogram_percentile, deterministic=True)
+	sql_connection.create_aggregate("duration_histogram", 1, _HistogramAggregate)
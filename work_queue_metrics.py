@@ -0,0 +1,187 @@
+#!/bin/env python3
+
+import bisect
+import collections
+import threading
+import time
+
+
+class LatencyHistogram(object):
+	"""
+	Histogram of durations (in seconds) with logarithmic buckets (each bucket is ~19% wider than the previous one),
+	so percentiles are estimated with a bounded relative error in a constant memory.
+	"""
+
+	# 1us .. ~4.8 hours (4 buckets per octave), longer durations fall into the overflow bucket
+	_BUCKET_COUNT = 137
+	_BUCKET_BOUNDS = [1e-6 * 2 ** (i / 4) for i in range(_BUCKET_COUNT)]
+
+	def __init__(self):
+		self._counts = [0] * (LatencyHistogram._BUCKET_COUNT + 1)
+		self._count = 0
+		self._sum = 0.0
+		self._max = 0.0
+
+	def record(self, value):
+		self._counts[bisect.bisect_left(LatencyHistogram._BUCKET_BOUNDS, value)] += 1
+		self._count += 1
+		self._sum += value
+		if value > self._max:
+			self._max = value
+
+	@property
+	def count(self):
+		return self._count
+
+	@property
+	def mean(self):
+		return 0.0 if self._count == 0 else self._sum / self._count
+
+	@property
+	def max(self):
+		return self._max
+
+	def percentile(self, p):
+		"""
+		:param p: percentile (0 - 100)
+		:return: upper bound of the bucket containing the percentile (capped by the max. value)
+		"""
+		if self._count == 0:
+			return 0.0
+
+		rank = p / 100.0 * self._count
+		cumulative = 0
+		for i, c in enumerate(self._counts):
+			cumulative += c
+			if cumulative >= rank and c > 0:
+				return min(self._max, LatencyHistogram._BUCKET_BOUNDS[i]) if i < LatencyHistogram._BUCKET_COUNT else self._max
+
+		return self._max
+
+	def snapshot(self):
+		return {
+			'count': self._count,
+			'mean': self.mean,
+			'p50': self.percentile(50),
+			'p90': self.percentile(90),
+			'p99': self.percentile(99),
+			'max': self._max,
+		}
+
+
+class WorkQueueMetrics(object):
+	"""
+	Throughput & latency metrics of a work queue.
+
+	 - gauges: named callables sampled by the snapshot (like queue depth or in-flight futures)
+	 - service time: time spent processing the message, per message type
+	 - latency: time from the enqueue till the message is finished
+	 - items per second: finished messages, overall and over the last {recent_window} seconds
+
+	Snapshots are pulled by snapshot() or pushed periodically to a callback (start_periodic_snapshots).
+	"""
+
+	def __init__(self, recent_window=10):
+		self._lock = threading.Lock()
+		self._recent_window = recent_window
+		# (second, finished count) of the last {recent_window} seconds
+		self._recent_finished = collections.deque()
+		self._gauges = dict()
+		self._service_times = dict()
+		self._latency = LatencyHistogram()
+		self._enqueued_count = 0
+		self._finished_count = 0
+		self._failed_count = 0
+		self._ts_start = time.perf_counter()
+		self._periodic_stop_event = None
+
+	def add_gauge(self, name, value_cb):
+		with self._lock:
+			self._gauges[name] = value_cb
+
+	def on_enqueue(self):
+		with self._lock:
+			self._enqueued_count += 1
+
+	def on_failed(self):
+		with self._lock:
+			self._failed_count += 1
+
+	def record_service_time(self, type_name, seconds):
+		with self._lock:
+			histogram = self._service_times.get(type_name)
+			if histogram is None:
+				histogram = self._service_times[type_name] = LatencyHistogram()
+			histogram.record(seconds)
+
+	def on_finished(self, type_name, service_seconds, latency_seconds):
+		with self._lock:
+			histogram = self._service_times.get(type_name)
+			if histogram is None:
+				histogram = self._service_times[type_name] = LatencyHistogram()
+			histogram.record(service_seconds)
+			self._latency.record(latency_seconds)
+			self._finished_count += 1
+
+			second = int(time.perf_counter())
+			if len(self._recent_finished) > 0 and self._recent_finished[-1][0] == second:
+				self._recent_finished[-1][1] += 1
+			else:
+				self._recent_finished.append([second, 1])
+				while self._recent_finished[0][0] <= second - self._recent_window:
+					self._recent_finished.popleft()
+
+	def snapshot(self):
+		"""
+		:return: dict with the current metrics
+		"""
+		with self._lock:
+			gauges = dict(self._gauges)
+			ts_now = time.perf_counter()
+			recent_finished = sum(c for second, c in self._recent_finished if second > int(ts_now) - self._recent_window)
+
+			snapshot = {
+				'uptime': ts_now - self._ts_start,
+				'enqueued': self._enqueued_count,
+				'finished': self._finished_count,
+				'failed': self._failed_count,
+				'items_per_second': self._finished_count / max(ts_now - self._ts_start, 1e-9),
+				'items_per_second_recent': recent_finished / min(max(ts_now - self._ts_start, 1e-9), self._recent_window),
+				'latency': self._latency.snapshot(),
+				'service_time': {name: h.snapshot() for name, h in self._service_times.items()},
+			}
+
+		# gauges are sampled outside of the lock, they may take locks of their own
+		snapshot['gauges'] = {name: value_cb() for name, value_cb in gauges.items()}
+		return snapshot
+
+	def start_periodic_snapshots(self, interval, snapshot_cb):
+		"""
+		Calls {snapshot_cb}(snapshot) every {interval} seconds from a daemon thread, till stop_periodic_snapshots.
+		"""
+		self.stop_periodic_snapshots()
+		stop_event = self._periodic_stop_event = threading.Event()
+
+		def _loop():
+			while not stop_event.wait(interval):
+				snapshot_cb(self.snapshot())
+
+		threading.Thread(target=_loop, daemon=True).start()
+
+	def stop_periodic_snapshots(self):
+		if self._periodic_stop_event is not None:
+			self._periodic_stop_event.set()
+			self._periodic_stop_event = None
+
+
+def format_snapshot(snapshot):
+	"""
+	One line summary of the snapshot (durations in milliseconds).
+	"""
+	gauges = ', '.join('%s: %s' % (name, value) for name, value in snapshot['gauges'].items())
+	service_times = ', '.join('%s: p50 %.2f / p99 %.2f' % (name, 1000 * h['p50'], 1000 * h['p99'])
+							  for name, h in snapshot['service_time'].items())
+	return '%s; finished: %d (%.1f/s), failed: %d; latency p50 %.2f / p90 %.2f / p99 %.2f; service: %s' % (
+		gauges, snapshot['finished'], snapshot['items_per_second_recent'], snapshot['failed'],
+		1000 * snapshot['latency']['p50'], 1000 * snapshot['latency']['p90'], 1000 * snapshot['latency']['p99'],
+		service_times)